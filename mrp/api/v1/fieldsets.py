@@ -0,0 +1,67 @@
+from rest_framework import serializers
+
+
+def requested_fields(request):
+    """
+    Return the names given in ?fields= and ?expand= as sets, or None for a
+    parameter the request does not carry.
+    """
+
+    def names(param):
+        if request is None or param not in request.query_params:
+            return None
+        return {name.strip() for name in request.query_params[param].split(",") if name.strip()}
+
+    return names("fields"), names("expand")
+
+
+def is_nested(serializer_class, name):
+    return isinstance(serializer_class._declared_fields.get(name), serializers.BaseSerializer)
+
+
+def wanted(serializer_class, name, fields, expand):
+    """
+    Whether field `name` is rendered in full: it is in ?fields= (or no
+    fields were asked for) and, for a nested serializer, in ?expand= (or no
+    expansion was asked for).
+    """
+    if fields is not None and name not in fields:
+        return False
+    return expand is None or name in expand or not is_nested(serializer_class, name)
+
+
+def load_related(request, queryset, serializer_class):
+    """
+    Add the select_related and prefetch_related lookups the serializer's
+    `related` map lists for the fields the request renders in full.
+    """
+    fields, expand = requested_fields(request)
+    for name, (joins, prefetches) in getattr(serializer_class, "related", {}).items():
+        if wanted(serializer_class, name, fields, expand):
+            queryset = queryset.select_related(*joins).prefetch_related(*prefetches)
+    return queryset
+
+
+class SparseFieldsMixin(object):
+    """
+    Serializer mixin for ?fields=id,total,... and ?expand=client,...
+
+    With ?fields= only the listed fields are rendered. With ?expand= only the
+    listed nested serializers are embedded and the others are rendered as
+    their primary key. Without either parameter, or when the serializer is
+    nested inside another one, every field is rendered as before.
+
+    `related` maps a field to the (select_related, prefetch_related) lookups
+    it needs, see `load_related`.
+    """
+
+    related = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields, expand = requested_fields(self.context.get("request"))
+        for name in list(self.fields):
+            if fields is not None and name not in fields:
+                self.fields.pop(name)
+            elif not wanted(type(self), name, fields, expand):
+                self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
@@ -72,6 +72,18 @@ ProductInfoSchema = ManualSchema(fields=[
         location="query",
         schema=coreschema.String()
     ),
+    coreapi.Field(
+        'fields',
+        required=False,
+        location="query",
+        schema=coreschema.String()
+    ),
+    coreapi.Field(
+        'expand',
+        required=False,
+        location="query",
+        schema=coreschema.String()
+    ),
 ])
 
 
@@ -82,6 +94,138 @@ RawInfoSchema = ManualSchema(fields=[
         location="query",
         schema=coreschema.String()
     ),
+    coreapi.Field(
+        'fields',
+        required=False,
+        location="query",
+        schema=coreschema.String()
+    ),
+    coreapi.Field(
+        'expand',
+        required=False,
+        location="query",
+        schema=coreschema.String()
+    ),
+])
+
+
+TimePhasedPlanSchema = ManualSchema(fields=[
+    coreapi.Field(
+        'granularity',
+        required=False,
+        location="query",
+        schema=coreschema.String()
+    ),
+    coreapi.Field(
+        'buckets',
+        required=False,
+        location="query",
+        schema=coreschema.Integer()
+    ),
+    coreapi.Field(
+        'start',
+        required=False,
+        location="query",
+        schema=coreschema.String()
+    ),
+])
+
+
+StockAtSchema = ManualSchema(fields=[
+    coreapi.Field(
+        'product_stock_name',
+        required=False,
+        location="query",
+        schema=coreschema.String()
+    ),
+    coreapi.Field(
+        'raw_stock_name',
+        required=False,
+        location="query",
+        schema=coreschema.String()
+    ),
+    coreapi.Field(
+        'date',
+        required=False,
+        location="query",
+        schema=coreschema.String()
+    ),
+])
+
+
+ImportStockSchema = ManualSchema(fields=[
+    coreapi.Field(
+        'file',
+        required=True,
+        location="form",
+        schema=coreschema.String()
+    ),
+    coreapi.Field(
+        'format',
+        required=False,
+        location="form",
+        schema=coreschema.String()
+    ),
+])
+
+
+StockValuationSchema = ManualSchema(fields=[
+    coreapi.Field(
+        'method',
+        required=False,
+        location="query",
+        schema=coreschema.String()
+    ),
+])
+
+
+PageSchema = ManualSchema(fields=[
+    coreapi.Field(
+        'cursor',
+        required=False,
+        location="query",
+        schema=coreschema.String()
+    ),
+    coreapi.Field(
+        'page_size',
+        required=False,
+        location="query",
+        schema=coreschema.Integer()
+    ),
+    coreapi.Field(
+        'fields',
+        required=False,
+        location="query",
+        schema=coreschema.String()
+    ),
+    coreapi.Field(
+        'expand',
+        required=False,
+        location="query",
+        schema=coreschema.String()
+    ),
+])
+
+
+BudgetRollupSchema = ManualSchema(fields=[
+    coreapi.Field(
+        'granularity',
+        required=False,
+        location="query",
+        schema=coreschema.String()
+    ),
+    coreapi.Field(
+        'from',
+        required=False,
+        location="query",
+        schema=coreschema.String()
+    ),
+    coreapi.Field(
+        'to',
+        required=False,
+        location="query",
+        schema=coreschema.String()
+    ),
 ])
 
 
@@ -164,7 +308,13 @@ CreateProductSchema = ManualSchema(fields=[
         required=False,
         location='form',
         schema=coreschema.Array()
-    )
+    ),
+    coreapi.Field(
+        'reorder_level',
+        required=False,
+        location="form",
+        schema=coreschema.Integer()
+    ),
 ])
 
 
@@ -192,7 +342,13 @@ UpdateProductSchema = ManualSchema(fields=[
         required=False,
         location="form",
         schema=coreschema.Integer()
-    )
+    ),
+    coreapi.Field(
+        'reorder_level',
+        required=False,
+        location="form",
+        schema=coreschema.Integer()
+    ),
 ])
 
 CreateProductTemplateSchema = ManualSchema(fields=[
@@ -217,6 +373,28 @@ CreateProductTemplateSchema = ManualSchema(fields=[
 ])
 
 
+CreateProductAssemblySchema = ManualSchema(fields=[
+    coreapi.Field(
+        name='product_name',
+        required=True,
+        location="form",
+        schema=coreschema.String()
+    ),
+    coreapi.Field(
+        name='component_name',
+        required=True,
+        location="form",
+        schema=coreschema.String()
+    ),
+    coreapi.Field(
+        name='quantity',
+        required=True,
+        location="form",
+        schema=coreschema.String()
+    ),
+])
+
+
 CreateRawSchema = ManualSchema(fields=[
     coreapi.Field(
         'raw_stock_name',
@@ -242,6 +420,12 @@ CreateRawSchema = ManualSchema(fields=[
         location="form",
         schema=coreschema.Integer()
     ),
+    coreapi.Field(
+        'reorder_level',
+        required=False,
+        location="form",
+        schema=coreschema.Integer()
+    ),
 ])
 
 UpdateRawSchema = ManualSchema(fields=[
@@ -269,6 +453,12 @@ UpdateRawSchema = ManualSchema(fields=[
         location="form",
         schema=coreschema.Integer()
     ),
+    coreapi.Field(
+        'reorder_level',
+        required=False,
+        location="form",
+        schema=coreschema.Integer()
+    ),
 ])
 
 
@@ -444,6 +634,56 @@ CreateRawOrderSchema = ManualSchema(fields=[
 ])
 
 
+ProductOrderFeasibilitySchema = ManualSchema(fields=[
+    coreapi.Field(
+        'items',
+        required=False,
+        location="form",
+        schema=coreschema.Array()
+    ),
+    coreapi.Field(
+        'product_name',
+        required=False,
+        location="form",
+        schema=coreschema.String()
+    ),
+    coreapi.Field(
+        'quantity',
+        required=False,
+        location="form",
+        schema=coreschema.Integer()
+    ),
+])
+
+
+SimulationSchema = ManualSchema(fields=[
+    coreapi.Field(
+        'scenarios',
+        required=False,
+        location="form",
+        schema=coreschema.Array()
+    ),
+    coreapi.Field(
+        'product_orders',
+        required=False,
+        location="form",
+        schema=coreschema.Array()
+    ),
+    coreapi.Field(
+        'raw_deliveries',
+        required=False,
+        location="form",
+        schema=coreschema.Array()
+    ),
+    coreapi.Field(
+        'price_changes',
+        required=False,
+        location="form",
+        schema=coreschema.Array()
+    ),
+])
+
+
 DamagedCreateRawOrderSchema = ManualSchema(fields=[
     coreapi.Field(
         'raw_name',
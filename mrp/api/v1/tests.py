@@ -1,12 +1,56 @@
+from datetime import timedelta
+from decimal import Decimal
+from contextlib import ExitStack
+from io import StringIO
+from unittest import mock
+from django.conf import settings
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse_lazy
+from django.utils import timezone
 from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase, APIClient
-from product.models import Product, Raw
+from product.models import Product, Raw, RawForProduction, ProductForProduction
+from product.bom import BOMCycleError, explode, load_flat_recipes
 from product.serializers import ProductSerializer, RawSerializer
-from stock.models import ProductStock, RawStock
+from stock.models import ProductStock, RawStock, StockMovement, ProductStockTotal, StockValuation
+from stock.tools import move_stock, take_snapshots, stock_count_at, check_product_stock_totals
+from stock.constant import ADJUSTMENT, CONSUMPTION
 from django.contrib.auth.hashers import make_password
 
 from profile.models import UserProfile
+from system.models import (
+    Client, Supplier, ProductOrder, RawOrder, MaterialRequirement, OrderPlan, StockAlert, Budget,
+    BudgetAccount, BudgetRollup, PayrollRun, TableVersion)
+from system.planning import (
+    run_mrp, replan_raws, time_phased_plan, suggest_raw_orders, load_producible, load_cached_on_hand)
+from system.simulation import simulate_many
+from system.reservations import release_reservations
+from system.constant import SUCCESS, FAIL
+from system.events import hub, publish, stream
+from system.alerts import deliver_stock_alerts
+from system.tasks import (
+    task_pay_salaries, task_replan_raws, task_release_reservations, task_deliver_stock_alerts)
+from system.ledger import rebuild_rollups, rebuild_totals
+from system.versions import add_versions
+
+
+def run_on_commit_callbacks():
+    """
+    Run the transaction.on_commit callbacks queued so far, which a TestCase
+    never commits, and return the events they published.
+    """
+    callbacks, connection.run_on_commit = connection.run_on_commit, []
+    with ExitStack() as stack:
+        for queued in (task_replan_raws, task_release_reservations, task_deliver_stock_alerts):
+            stack.enter_context(mock.patch.object(queued, 'delay'))
+        publish = stack.enter_context(mock.patch.object(hub, 'publish'))
+        for savepoint_ids, callback in callbacks:
+            callback()
+    return [args[0] for args, kwargs in publish.call_args_list]
 
 
 class Test(APITestCase):
@@ -29,3 +73,602 @@ class Test(APITestCase):
         response = client.put(url, data)
         user = UserProfile.objects.get(email='utkucanbykl@test.com')
         self.assertTrue(user.check_password('123456'))
+
+
+class CatalogMixin(object):
+
+    def setUp(self):
+        self.products = {}
+        for name in ('assembly', 'frame', 'wheel'):
+            stock = ProductStock.objects.create(name=name)
+            self.products[name] = Product.objects.create(stock=stock, name=name, unit_price=10)
+        self.raws = {}
+        for name in ('steel', 'rubber'):
+            stock = RawStock.objects.create(name=name, count=100)
+            self.raws[name] = Raw.objects.create(stock=stock, name=name, unit_price=1)
+        ProductForProduction.objects.create(
+            product=self.products['assembly'], component=self.products['frame'], quantity_for_prod=2)
+        ProductForProduction.objects.create(
+            product=self.products['frame'], component=self.products['wheel'], quantity_for_prod=3)
+        RawForProduction.objects.create(
+            product=self.products['assembly'], raw=self.raws['steel'], quantity_for_prod=1)
+        RawForProduction.objects.create(
+            product=self.products['wheel'], raw=self.raws['rubber'], quantity_for_prod=2)
+        RawForProduction.objects.create(
+            product=self.products['frame'], raw=self.raws['steel'], quantity_for_prod=4)
+        self.client_obj = Client.objects.create(email='client@test.com')
+
+
+class BOMTest(CatalogMixin, APITestCase):
+
+    def test_explode(self):
+        requirements = explode(self.products['assembly'].id, 2)
+        self.assertEqual(requirements[self.raws['steel'].id], 2 + 2 * 2 * 4)
+        self.assertEqual(requirements[self.raws['rubber'].id], 2 * 2 * 3 * 2)
+
+    def test_cycle(self):
+        with self.assertRaises(BOMCycleError):
+            ProductForProduction.objects.create(
+                product=self.products['wheel'], component=self.products['assembly'])
+
+    def test_flat_recipes(self):
+        recipes = load_flat_recipes([self.products['assembly'].id])
+        self.assertEqual(recipes[self.products['assembly'].id], {
+            self.raws['steel'].id: 1 + 2 * 4,
+            self.raws['rubber'].id: 2 * 3 * 2,
+        })
+        RawForProduction.objects.filter(product=self.products['wheel']).delete()
+        RawForProduction.objects.create(
+            product=self.products['wheel'], raw=self.raws['rubber'], quantity_for_prod=1)
+        recipes = load_flat_recipes([self.products['assembly'].id])
+        self.assertEqual(recipes[self.products['assembly'].id][self.raws['rubber'].id], 2 * 3)
+        run_on_commit_callbacks()
+        version = TableVersion.objects.get(name='product.product').version
+        call_command('rebuild_flat_recipes', stdout=StringIO())
+        run_on_commit_callbacks()
+        self.assertEqual(TableVersion.objects.get(name='product.product').version, version + 1)
+
+
+class PlanningTest(CatalogMixin, APITestCase):
+
+    def test_run_mrp(self):
+        first = ProductOrder.objects.create(
+            client=self.client_obj, product=self.products['assembly'], quantity=2)
+        second = ProductOrder.objects.create(
+            client=self.client_obj, product=self.products['wheel'], quantity=1)
+        RawStock.objects.filter(name='steel').update(count=10)
+        summary = run_mrp()
+        self.assertEqual(summary['orders'], 2)
+        steel = MaterialRequirement.objects.get(raw=self.raws['steel'])
+        self.assertEqual(steel.gross_requirement, 18)
+        self.assertEqual(steel.net_requirement, 8)
+        self.assertFalse(OrderPlan.objects.get(product_order=first).feasible)
+        self.assertTrue(OrderPlan.objects.get(product_order=second).feasible)
+
+        RawStock.objects.filter(name='steel').update(count=18)
+        replan_raws([self.raws['steel'].stock_id])
+        self.assertEqual(MaterialRequirement.objects.get(raw=self.raws['steel']).net_requirement, 0)
+        self.assertTrue(OrderPlan.objects.get(product_order=first).feasible)
+        self.assertEqual(OrderPlan.objects.count(), 2)
+
+    def test_time_phased_plan(self):
+        today = timezone.localdate()
+        ProductOrder.objects.create(
+            client=self.client_obj, product=self.products['wheel'], quantity=10,
+            delivery_date=(today + timedelta(days=2)).strftime('%d.%m.%Y'))
+        RawStock.objects.filter(name='rubber').update(count=15)
+        RawOrder.objects.create(
+            supplier=Supplier.objects.create(email='supplier@test.com'), raw=self.raws['rubber'],
+            quantity=3, delivery_date=str(today + timedelta(days=4)))
+        plan = time_phased_plan(today, 6)
+        rubber = plan['raws'][self.raws['rubber'].id]
+        self.assertEqual(rubber['projected_on_hand'], [15, 15, -5, -5, -2, -2])
+        self.assertEqual(rubber['net_requirement'], [0, 0, 5, 0, 0, 0])
+        user = UserProfile.objects.create(email='planner@test.com')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.get(user=user).key)
+        url = reverse_lazy('api:time_phased_plan_service')
+        self.assertEqual(client.get(url, {'granularity': 'week'}).status_code, 200)
+        self.assertEqual(client.get(url, {'granularity': 'month'}).status_code, 400)
+
+    def test_feasibility(self):
+        user = UserProfile.objects.create(email='sales@test.com')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.get(user=user).key)
+        response = client.post(reverse_lazy('api:product_order_feasibility_service'), {
+            'items': [{'product_name': 'assembly', 'quantity': 5},
+                      {'product_name': 'wheel', 'quantity': 25}],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['items'][0]['feasible'])
+        self.assertTrue(response.data['items'][1]['feasible'])
+        self.assertFalse(response.data['feasible'])
+        self.assertEqual(response.data['shortages'][0]['shortfall'], 60 + 50 - 100)
+        self.assertEqual(ProductOrder.objects.count(), 0)
+        move_stock(RawStock, {self.raws['rubber'].stock_id: 10})
+        run_on_commit_callbacks()
+        # the raw's cached stock was replaced on commit
+        with self.assertNumQueries(0):
+            on_hand = load_cached_on_hand([self.raws['rubber'].id, self.raws['steel'].id])
+        self.assertEqual(on_hand[self.raws['rubber'].id], 110)
+
+    def test_simulation(self):
+        scenarios = [
+            {'product_orders': [{'product_name': 'wheel', 'quantity': 60, 'status': 'SUCCESS'}]},
+            {'raw_deliveries': [{'raw_name': 'rubber', 'quantity': 30}],
+             'price_changes': [{'raw_name': 'rubber', 'unit_price': 2}],
+             'product_orders': [{'product_name': 'wheel', 'quantity': 60}]},
+        ]
+        short, covered = simulate_many(scenarios, workers=2)
+        self.assertEqual(short['shortages'], [{'raw_name': 'rubber', 'shortfall': 20}])
+        self.assertEqual(short['product_stock'], {'wheel': 60})
+        self.assertEqual(short['budget_total'], 600)
+        self.assertEqual(covered['shortages'], [])
+        self.assertEqual(covered['raw_stock'], {'rubber': 10})
+        self.assertEqual(covered['budget_total'], -60)
+        self.assertEqual(RawStock.objects.get(name='rubber').count, 100)
+
+    def test_suggest_raw_orders(self):
+        supplier = Supplier.objects.create(email='supplier@test.com')
+        RawOrder.objects.create(supplier=supplier, raw=self.raws['rubber'], quantity=1, status='FAIL')
+        ProductOrder.objects.create(client=self.client_obj, product=self.products['wheel'], quantity=40)
+        RawStock.objects.filter(name='rubber').update(count=50)
+        run_on_commit_callbacks()
+        version = TableVersion.objects.get(name='system.raworder').version
+        self.assertEqual(suggest_raw_orders(), {'created': 1, 'skipped': []})
+        run_on_commit_callbacks()
+        self.assertEqual(TableVersion.objects.get(name='system.raworder').version, version + 1)
+        suggestion = RawOrder.objects.get(status='WAITING')
+        self.assertEqual((suggestion.supplier, suggestion.quantity, suggestion.total), (supplier, 30, 30))
+        self.assertEqual(suggest_raw_orders()['created'], 0)
+
+    def test_producible(self):
+        report = load_producible()
+        self.assertEqual(report[self.products['assembly'].id], 100 // 12)
+        self.assertEqual(report[self.products['wheel'].id], 100 // 2)
+        stock = RawStock.objects.get(name='rubber')
+        stock.count = 24
+        stock.save()
+        self.assertEqual(load_producible()[self.products['wheel'].id], 100 // 2)
+        run_on_commit_callbacks()
+        report = load_producible()
+        self.assertEqual(report[self.products['assembly'].id], 2)
+        self.assertEqual(report[self.products['wheel'].id], 12)
+
+
+    def test_producible_ignores_zero_quantities(self):
+        RawForProduction.objects.create(
+            product=self.products['wheel'], raw=self.raws['steel'], quantity_for_prod=0)
+        user = UserProfile.objects.create(email='producible@test.com')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.get(user=user).key)
+        response = client.get(reverse_lazy('api:product_producible_service'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(load_producible()[self.products['wheel'].id], 100 // 2)
+
+
+class StockMovementTest(CatalogMixin, APITestCase):
+
+    def test_order_moves_stock_in_one_update(self):
+        move_stock(RawStock, {self.raws['steel'].stock_id: -1, self.raws['rubber'].stock_id: 1})
+        # savepoint, UPDATE of every count, the valuations, the open cost
+        # layers of the issued stocks and their UPDATE, the receipt's layer,
+        # one valuation UPDATE, one ledger INSERT, release, then the alerts of
+        # the moved stocks only
+        with self.assertNumQueries(11):
+            move_stock(RawStock, {self.raws['steel'].stock_id: -4, self.raws['rubber'].stock_id: 2})
+        self.assertEqual(RawStock.objects.get(name='steel').count, 95)
+        self.assertEqual(RawStock.objects.get(name='rubber').count, 103)
+        order = ProductOrder.objects.create(
+            client=self.client_obj, product=self.products['assembly'], quantity=2)
+        steel = RawStock.objects.get(name='steel')
+        self.assertEqual((steel.count, steel.reserved), (95, 18))
+        order.status = SUCCESS
+        order.save()
+        self.assertEqual(RawStock.objects.get(name='steel').count, 95 - 18)
+        self.assertEqual(RawStock.objects.get(name='rubber').count, 103 - 24)
+        self.assertEqual(RawStock.objects.get(name='rubber').reserved, 0)
+
+    def test_move_stock_queries_do_not_grow_with_stocks(self):
+        stocks = [RawStock.objects.create(name='part {}'.format(i), count=50) for i in range(40)]
+
+        def count_queries(size):
+            with CaptureQueriesContext(connection) as queries:
+                move_stock(RawStock, {stock.id: 1 if i % 2 else -1
+                                      for i, stock in enumerate(stocks[:size])})
+            return len(queries)
+
+        # the first moves also open the missing valuations
+        self.assertEqual(count_queries(2), count_queries(40))
+        self.assertEqual(count_queries(2), count_queries(10))
+        self.assertEqual(count_queries(10), count_queries(40))
+
+    def test_insufficient_stock_rolls_back(self):
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                ProductOrder.objects.create(
+                    client=self.client_obj, product=self.products['assembly'], quantity=10)
+        self.assertFalse(ProductOrder.objects.exists())
+        self.assertEqual(RawStock.objects.get(name='steel').count, 100)
+
+    def test_stock_count_at_uses_snapshot_and_ledger(self):
+        steel = self.raws['steel'].stock_id
+        take_snapshots()
+        order = ProductOrder.objects.create(
+            client=self.client_obj, product=self.products['assembly'], quantity=1)
+        self.assertFalse(StockMovement.objects.exists())
+        order.status = SUCCESS
+        order.save()
+        self.assertEqual(
+            list(StockMovement.objects.filter(raw_stock_id=steel).values_list('delta', 'reason')),
+            [(-9, CONSUMPTION)])
+        before = timezone.now()
+        move_stock(RawStock, {steel: 20})
+        self.assertEqual(stock_count_at(RawStock, steel, before), 91)
+        self.assertEqual(stock_count_at(RawStock, steel, timezone.now()), 111)
+        take_snapshots()
+        self.assertEqual(stock_count_at(RawStock, steel, timezone.now()), 111)
+
+
+class ProductStockTotalTest(CatalogMixin, APITestCase):
+
+    def test_product_stock_totals_follow_deltas(self):
+        first = ProductStock.objects.create(name='bolt', count=5)
+        second = ProductStock.objects.create(name='bolt', count=7)
+        self.assertEqual(first.count, 5)
+        move_stock(ProductStock, {first.id: 3})
+        second = ProductStock.objects.get(id=second.id)
+        second.count = 10
+        second.save()
+        self.assertEqual(ProductStockTotal.objects.get(name='bolt').count, 18)
+        second.delete()
+        self.assertEqual(ProductStockTotal.objects.get(name='bolt').count, 8)
+        self.assertEqual(check_product_stock_totals(), {})
+        ProductStockTotal.objects.filter(name='bolt').update(count=1)
+        self.assertEqual(check_product_stock_totals(fix=True), {'bolt': (8, 1)})
+        self.assertEqual(ProductStockTotal.objects.get(name='bolt').count, 8)
+
+
+class StockReservationTest(CatalogMixin, APITestCase):
+
+    def test_reservations_released_on_fail_and_expiry(self):
+        failed = ProductOrder.objects.create(
+            client=self.client_obj, product=self.products['assembly'], quantity=2)
+        expired = ProductOrder.objects.create(
+            client=self.client_obj, product=self.products['assembly'], quantity=3)
+        self.assertEqual(RawStock.objects.get(name='rubber').available, 100 - 60)
+        failed.status = FAIL
+        failed.save()
+        self.assertEqual(release_reservations(), {'released': 2, 'expired_orders': 0})
+        self.assertEqual(RawStock.objects.get(name='rubber').reserved, 36)
+        later = timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_TTL + 1)
+        run_on_commit_callbacks()
+        version = TableVersion.objects.get(name='system.productorder').version
+        self.assertEqual(release_reservations(later), {'released': 2, 'expired_orders': 1})
+        events = run_on_commit_callbacks()
+        self.assertIn(
+            {'type': 'product_order', 'id': expired.id, 'product': expired.product_id,
+             'quantity': expired.quantity, 'status': FAIL, 'created': False}, events)
+        self.assertEqual(TableVersion.objects.get(name='system.productorder').version, version + 1)
+        self.assertEqual(ProductOrder.objects.get(id=expired.id).status, FAIL)
+        self.assertEqual(RawStock.objects.get(name='rubber').reserved, 0)
+        self.assertEqual(RawStock.objects.get(name='rubber').count, 100)
+
+    def test_expired_order_consumes_recipe_on_success(self):
+        user = UserProfile.objects.create(email='orders@test.com')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.get(user=user).key)
+        expired = ProductOrder.objects.create(
+            client=self.client_obj, product=self.products['assembly'], quantity=2)
+        later = timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_TTL + 1)
+        self.assertEqual(release_reservations(later)['expired_orders'], 1)
+        ProductOrder.objects.create(
+            client=self.client_obj, product=self.products['assembly'], quantity=3)
+        response = client.patch(
+            reverse_lazy('api:product_order_update_service', kwargs={'id': expired.id}),
+            {'status': SUCCESS})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(RawStock.objects.get(name='steel').count, 100 - 18)
+        self.assertEqual(RawStock.objects.get(name='rubber').count, 100 - 24)
+        self.assertEqual(StockMovement.objects.filter(reason=CONSUMPTION).count(), 2)
+        self.assertEqual(ProductStock.objects.get(name='assembly').count, 2)
+        # the waiting order holds 36 rubber, so 50 leaves 14 for the next one
+        RawStock.objects.filter(name='rubber').update(count=50)
+        failed = ProductOrder.objects.create(
+            client=self.client_obj, product=self.products['assembly'], quantity=2, status=FAIL)
+        response = client.patch(
+            reverse_lazy('api:product_order_update_service', kwargs={'id': failed.id}),
+            {'status': SUCCESS})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ProductOrder.objects.get(id=failed.id).status, FAIL)
+        self.assertEqual(RawStock.objects.get(name='rubber').count, 50)
+        self.assertEqual(ProductStock.objects.get(name='assembly').count, 2)
+
+
+class StockValuationTest(CatalogMixin, APITestCase):
+
+    def test_stock_valuation(self):
+        supplier = Supplier.objects.create(email='supplier@test.com')
+        steel = self.raws['steel']
+        for unit_price in (Decimal(2), Decimal(5)):
+            steel.unit_price = unit_price
+            steel.save()
+            RawOrder.objects.create(supplier=supplier, raw=steel, quantity=10, status=SUCCESS)
+        valuation = StockValuation.objects.get(raw_stock_id=steel.stock_id)
+        self.assertEqual((valuation.quantity, valuation.average_value, valuation.fifo_value),
+                         (120, Decimal(70), Decimal(70)))
+        move_stock(RawStock, {steel.stock_id: -108})
+        valuation.refresh_from_db()
+        # first in, first out: the 100 opening units at no cost, then 8 at 2
+        self.assertEqual((valuation.quantity, valuation.average_value, valuation.fifo_value),
+                         (12, Decimal(7), Decimal(54)))
+        order = ProductOrder.objects.create(
+            client=self.client_obj, product=self.products['assembly'], quantity=1)
+        order.status = SUCCESS
+        order.save()
+        user = UserProfile.objects.create(email='valuation@test.com')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.get(user=user).key)
+        response = client.get(reverse_lazy('api:stock_valuation_service'), {'method': 'fifo'})
+        items = {(item['type'], item['name']): item for item in response.data['items']}
+        self.assertEqual(items['raw', 'steel']['value'], Decimal(15))
+        self.assertEqual(items['product', 'assembly']['value'], Decimal(39))
+        response = client.get(reverse_lazy('api:stock_valuation_service'))
+        items = {(item['type'], item['name']): item for item in response.data['items']}
+        self.assertEqual(items['raw', 'steel']['value'], Decimal('1.75'))
+        self.assertEqual(items['product', 'assembly']['value'], Decimal('5.25'))
+        response = client.get(reverse_lazy('api:stock_valuation_service'), {'method': 'lifo'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_stock_edit_moves_valuation(self):
+        user = UserProfile.objects.create(email='stock@test.com')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.get(user=user).key)
+        steel = self.raws['steel'].stock_id
+        move_stock(RawStock, {steel: 20}, costs={steel: (Decimal(40), Decimal(40))})
+        response = client.patch(
+            reverse_lazy('api:raw_stock_update_service', kwargs={'id': steel}), {'count': 90})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 90)
+        valuation = StockValuation.objects.get(raw_stock_id=steel)
+        # the 30 units taken come from the 100 opening units at no cost
+        self.assertEqual((valuation.quantity, valuation.average_value, valuation.fifo_value),
+                         (90, Decimal(30), Decimal(40)))
+        self.assertEqual(StockMovement.objects.filter(raw_stock_id=steel).latest('id').reason,
+                         ADJUSTMENT)
+
+
+class StockImportTest(CatalogMixin, APITestCase):
+
+    def test_stock_import(self):
+        ProductOrder.objects.create(client=self.client_obj, product=self.products['assembly'], quantity=1)
+        user = UserProfile.objects.create(email='stock@test.com')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.get(user=user).key)
+        upload = SimpleUploadedFile('count.csv', (
+            'type,name,count,delta\n'
+            'raw,steel,40,\n'
+            'raw,steel,,-5\n'
+            'raw,rubber,5,\n'
+            'raw,copper,1,\n'
+            'raw,steel,1,2\n').encode())
+        response = client.post(reverse_lazy('api:stock_import_service'), {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['rows'], 5)
+        self.assertEqual(response.data['applied'], 2)
+        self.assertEqual([error['line'] for error in response.data['errors']], [4, 5, 6])
+        self.assertEqual(RawStock.objects.get(name='steel').count, 35)
+        self.assertEqual(RawStock.objects.get(name='rubber').count, 100)
+
+
+class EventStreamTest(CatalogMixin, APITestCase):
+
+    @override_settings(EVENT_BUS_URL=None)
+    def test_event_stream(self):
+        events = stream({'raw_stock'})
+        self.assertEqual(next(events), 'retry: 1000\n\n')
+        publish({'type': 'product_order', 'id': 1})
+        publish({'type': 'raw_stock', 'deltas': {self.raws['steel'].stock_id: -5}})
+        self.assertEqual(
+            next(events),
+            'event: raw_stock\ndata: {"type": "raw_stock", "deltas": {"%d": -5}}\n\n'
+            % self.raws['steel'].stock_id)
+        events.close()
+        self.assertFalse(hub.subscriptions)
+
+
+class StockAlertTest(CatalogMixin, APITestCase):
+
+    def test_low_stock_alerts(self):
+        steel = self.raws['steel']
+        steel.reorder_level = 95
+        steel.save()
+        self.assertFalse(StockAlert.objects.exists())
+        ProductOrder.objects.create(client=self.client_obj, product=self.products['assembly'], quantity=1)
+        alert = StockAlert.objects.get()
+        self.assertEqual((alert.raw_id, alert.count, alert.notified), (steel.id, 91, False))
+        self.assertEqual(deliver_stock_alerts(), 1)
+        self.assertEqual(deliver_stock_alerts(), 0)
+        user = UserProfile.objects.create(email='alerts@test.com')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.get(user=user).key)
+        response = client.get(reverse_lazy('api:stock_alert_list_service'))
+        self.assertEqual(response.data[0]['name'], 'steel')
+        move_stock(RawStock, {steel.stock_id: 20})
+        self.assertFalse(StockAlert.objects.exists())
+
+
+class BudgetLedgerTest(CatalogMixin, APITestCase):
+
+    def test_budget_postings_share_one_balance(self):
+        Budget.objects.create(total=Decimal(500))
+        # reading the balance before the account is opened writes nothing
+        self.assertEqual(simulate_many([{}])[0]['budget_total'], Decimal(500))
+        user = UserProfile.objects.create(email='budget@test.com')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.get(user=user).key)
+        response = client.get(reverse_lazy('api:total_budget_service'))
+        self.assertEqual(Decimal(response.data['total']), Decimal(500))
+        self.assertFalse(BudgetAccount.objects.exists())
+        supplier = Supplier.objects.create(email='supplier@test.com')
+        order = ProductOrder.objects.create(
+            client=self.client_obj, product=self.products['wheel'], quantity=2)
+        order.status = SUCCESS
+        order.save()
+        raw_order = RawOrder.objects.create(
+            supplier=supplier, raw=self.raws['steel'], quantity=10, status=SUCCESS)
+        # re-saving completed orders neither posts nor moves stock again
+        order.order_title = 'repeat'
+        order.save()
+        raw_order.save()
+        self.assertEqual(ProductStock.objects.get(name='wheel').count, 2)
+        self.assertEqual(RawStock.objects.get(name='steel').count, 110)
+        # wheel 2 x 10, steel 10 x 1, opened from the legacy 500
+        self.assertEqual(BudgetAccount.objects.get().total, Decimal(500 + 20 - 10))
+        self.assertEqual(Budget.objects.order_by('-id').first().total, Decimal(510))
+
+    def test_rebuild_totals(self):
+        Budget.objects.create(total=Decimal(500))
+        supplier = Supplier.objects.create(email='supplier@test.com')
+        ProductOrder.objects.create(
+            client=self.client_obj, product=self.products['wheel'], quantity=2, status=SUCCESS)
+        RawOrder.objects.create(
+            supplier=supplier, raw=self.raws['steel'], quantity=10, status=SUCCESS)
+        self.assertEqual(rebuild_totals(opening=Decimal(500))['divergent'], 0)
+        Budget.objects.filter(total=Decimal(520)).update(total=Decimal(999))
+        report = rebuild_totals(opening=Decimal(500), fix=True, chunk_size=1)
+        self.assertEqual((report['rows'], report['divergent'], report['drift']), (3, 1, 0))
+        self.assertEqual(rebuild_totals(opening=Decimal(500))['divergent'], 0)
+        self.assertEqual(BudgetAccount.objects.get().total, Decimal(510))
+
+    def test_budget_rollups(self):
+        supplier = Supplier.objects.create(email='supplier@test.com')
+        order = ProductOrder.objects.create(
+            client=self.client_obj, product=self.products['wheel'], quantity=2)
+        order.status = SUCCESS
+        order.save()
+        RawOrder.objects.create(supplier=supplier, raw=self.raws['steel'], quantity=10, status=SUCCESS)
+        today = timezone.localdate()
+        rollups = {
+            rollup.granularity: (rollup.period, rollup.income, rollup.expense, rollup.net)
+            for rollup in BudgetRollup.objects.all()
+        }
+        self.assertEqual(rollups, {
+            'day': (today, Decimal(20), Decimal(10), Decimal(10)),
+            'month': (today.replace(day=1), Decimal(20), Decimal(10), Decimal(10)),
+        })
+        BudgetRollup.objects.update(net=0)
+        self.assertEqual(rebuild_rollups(), 2)
+        user = UserProfile.objects.create(email='rollup@test.com')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.get(user=user).key)
+        response = client.get(reverse_lazy('api:budget_rollup_service'), {
+            'granularity': 'day', 'from': str(today), 'to': str(today)})
+        self.assertEqual(len(response.data), 1)
+        self.assertEqual(Decimal(response.data[0]['net']), Decimal(10))
+
+
+class PayrollTest(CatalogMixin, APITestCase):
+
+    def test_run_payroll(self):
+        Budget.objects.create(total=Decimal(500))
+        UserProfile.objects.create(email='worker@test.com', salary=Decimal(100))
+        task_pay_salaries()
+        self.assertEqual(BudgetAccount.objects.get().total, Decimal(400))
+        self.assertEqual(Budget.objects.order_by('-id').first().total, Decimal(400))
+        # a second run for the same month pays nothing
+        task_pay_salaries()
+        payroll_run = PayrollRun.objects.get()
+        self.assertEqual((payroll_run.employees, payroll_run.total), (1, Decimal(100)))
+        self.assertEqual(payroll_run.payslips.get().user.email, 'worker@test.com')
+        self.assertEqual(BudgetAccount.objects.get().total, Decimal(400))
+
+
+class PaginationTest(CatalogMixin, APITestCase):
+
+    def test_budget_detail_query_count(self):
+        supplier = Supplier.objects.create(email='supplier@test.com')
+        user = UserProfile.objects.create(email='budget@test.com')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.get(user=user).key)
+        url = reverse_lazy('api:total_detail_budget_service')
+
+        def post_orders():
+            ProductOrder.objects.create(
+                client=self.client_obj, product=self.products['wheel'], quantity=1, status=SUCCESS)
+            RawOrder.objects.create(supplier=supplier, raw=self.raws['steel'], quantity=1, status=SUCCESS)
+
+        post_orders()
+        # token, table versions, budget rows with their orders, recipes, flat recipes, attrs
+        with self.assertNumQueries(6):
+            response = client.get(url)
+        self.assertEqual((len(response.data['results']), response.data['next']), (2, None))
+        for i in range(5):
+            post_orders()
+        seen = []
+        response = client.get(url, {'page_size': 5})
+        while True:
+            seen += [row['id'] for row in response.data['results']]
+            if not response.data['next']:
+                break
+            with self.assertNumQueries(6):
+                response = client.get(response.data['next'])
+        self.assertEqual(seen, list(Budget.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+        product = response.data['results'][-1]['product_order']['product']
+        recipe = RawForProduction.objects.get(product=self.products['wheel'])
+        self.assertEqual(
+            [(row['id'], row['quantity_for_prod']) for row in product['raw_for_prod']], [(recipe.id, 2)])
+        self.assertEqual(product['flat_raw_for_prod'][0]['quantity_for_prod'], 2)
+
+
+class SparseFieldsTest(CatalogMixin, APITestCase):
+
+    def test_sparse_fieldsets(self):
+        order = ProductOrder.objects.create(
+            client=self.client_obj, product=self.products['wheel'], quantity=1)
+        user = UserProfile.objects.create(email='fields@test.com')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.get(user=user).key)
+        url = reverse_lazy('api:product_order_list_service')
+        # token, table versions, orders with no joins
+        with self.assertNumQueries(3):
+            response = client.get(url, {'fields': 'id,quantity,product', 'expand': ''})
+        self.assertEqual(response.data['results'], [
+            {'id': order.id, 'quantity': '1.00', 'product': self.products['wheel'].id}])
+        # token, table versions, orders joined with their client
+        with self.assertNumQueries(3):
+            response = client.get(url, {'expand': 'client'})
+        self.assertEqual(response.data['results'][0]['client']['email'], 'client@test.com')
+        self.assertEqual(response.data['results'][0]['product'], self.products['wheel'].id)
+        response = client.get(url)
+        self.assertEqual(response.data['results'][0]['product']['name'], 'wheel')
+        response = client.get(reverse_lazy('api:product_stock_list_service'), {'fields': 'id,count'})
+        self.assertEqual(response.data[0].keys(), {'id', 'count'})
+        response = client.get(reverse_lazy('api:raw_stock_list_service'), {'fields': 'name,available'})
+        self.assertEqual(sorted(response.data, key=lambda row: row['name']),
+                         [{'name': 'rubber', 'available': 98}, {'name': 'steel', 'available': 100}])
+
+
+class ConditionalListTest(CatalogMixin, APITestCase):
+
+    def test_conditional_get(self):
+        user = UserProfile.objects.create(email='etag@test.com')
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + Token.objects.get(user=user).key)
+        url = reverse_lazy('api:product_order_list_service')
+        response = client.get(url)
+        etag = response['ETag']
+        # token, table versions
+        with self.assertNumQueries(2):
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertNotEqual(client.get(url, {'fields': 'id'})['ETag'], etag)
+        ProductOrder.objects.create(client=self.client_obj, product=self.products['wheel'], quantity=1)
+        add_versions(['system.productorder'])
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, len(response.data['results'])), (200, 1))
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertFalse(response.has_header('Last-Modified'))
+        # a date alone never validates, writes within one second would be missed
+        response = client.get(url, HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
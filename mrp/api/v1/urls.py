@@ -15,6 +15,8 @@ urlpatterns = [
 
     path('product_stock/list', list_product_stock_view,
          name='product_stock_list_service'),
+    path('product_stock/total/list', list_product_stock_total_view,
+         name='product_stock_total_list_service'),
     path('product_stock/create', create_product_stock_view,
          name='product_stock_create_service'),
     path('product_stock/update/<int:id>/', ProductStockUpdateAPIView.as_view(),
@@ -26,6 +28,8 @@ urlpatterns = [
     path('product/list/all', list_all_product_info_view,
          name='product_all_list_service'),
     path('product/create', create_product_view, name='product_create_service'),
+    path('product/producible', list_producible_view,
+         name='product_producible_service'),
     path('product/attr/create', ProductAttrCreateView.as_view(),
          name='product_attr_create'),
 
@@ -43,6 +47,9 @@ urlpatterns = [
     path('product_template/delete/<int:id>/', ProductTemplateDeleteAPIView.as_view(),
          name='product_template_delete_service'),
 
+    path('product_assembly/create', create_product_assembly_view,
+         name='product_assembly_create_service'),
+
     path('raw_stock/list', list_raw_stock_view, name='raw_stock_list_service'),
     path('raw_stock/create', create_raw_stock_view,
          name='raw_stock_create_service'),
@@ -50,6 +57,11 @@ urlpatterns = [
          name='raw_stock_update_service'),
     path('raw_stock/delete/<int:id>/', RawStockDeleteAPIView.as_view(),
          name='raw_stock_delete_service'),
+    path('stock/at', stock_at_view, name='stock_at_service'),
+    path('stock/import', import_stock_view, name='stock_import_service'),
+    path('stock/alerts', list_stock_alert_view, name='stock_alert_list_service'),
+    path('stock/valuation', stock_valuation_view, name='stock_valuation_service'),
+    path('events/stream', events_stream_view, name='events_stream_service'),
 
     path('raw/list', list_raw_info_view, name='raw_list_service'),
     path('raw/list/all', list_all_raw_info_view, name='raw_all_list_service'),
@@ -78,6 +90,8 @@ urlpatterns = [
          name='product_order_list_service'),
     path('product_order/create', create_product_order_view,
          name='product_order_create_service'),
+    path('product_order/feasibility', product_order_feasibility_view,
+         name='product_order_feasibility_service'),
     path('product_order/update/<int:id>/', ProductOrderUpdateAPIView.as_view(),
          name='product_order_update_service'),
     path('product_order/delete/<int:id>/', ProductOrderDeleteAPIView.as_view(),
@@ -86,6 +100,8 @@ urlpatterns = [
     path('raw_order/list', list_raw_order_view, name='raw_order_list_service'),
     path('raw_order/create', create_raw_order_view,
          name='raw_order_create_service'),
+    path('raw_order/suggest', suggest_raw_order_view,
+         name='raw_order_suggest_service'),
     path('raw_order/update/<int:id>/', RawOrderUpdateAPIView.as_view(),
          name='raw_order_update_service'),
     path('raw_order/delete/<int:id>/', RawOrderDeleteAPIView.as_view(),
@@ -115,5 +131,12 @@ urlpatterns = [
          name='income_detail_and_total_budget_service'),
     path('budget/total/outcome/', budget_outcome_detail_and_total_view,
          name='outcome_detail_and_total_budget_service'),
+    path('budget/rollup', budget_rollup_view, name='budget_rollup_service'),
+
+    path('planning/requirement/list', list_material_requirement_view,
+         name='material_requirement_list_service'),
+    path('planning/time_phased', time_phased_plan_view,
+         name='time_phased_plan_service'),
+    path('planning/simulate', simulation_view, name='simulation_service'),
 
 ]
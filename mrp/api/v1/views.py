@@ -8,7 +8,13 @@ from rest_framework.authtoken.models import Token
 from rest_framework.response import Response
 from rest_framework.generics import CreateAPIView
 from rest_framework.views import APIView
+from rest_framework.exceptions import ValidationError
 from django.db.models import F
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time
+import io
 from rest_framework import status
 from api.v1.schemas import (
     RegisterSchema,
@@ -26,16 +32,32 @@ from api.v1.schemas import (
     DamagedCreateRawOrderSchema,
     DamagedCreateProductOrderSchema,
     CreateProductTemplateSchema,
+    CreateProductAssemblySchema,
     UpdatePassword,
     UpdateProductSchema,
     UpdateRawSchema,
     NotAuthenticatedUpdatePassword,
     UpdateProductStockSchema,
     ProductAttrCreateSchema,
+    TimePhasedPlanSchema,
+    ProductOrderFeasibilitySchema,
+    SimulationSchema,
+    StockAtSchema,
+    ImportStockSchema,
+    StockValuationSchema,
+    BudgetRollupSchema,
+    PageSchema,
 )
 from api.v1.tools import create_profile, check_user_is_valid
+from api.v1.pagination import paginate
+from api.v1.fieldsets import load_related
+from api.v1.conditional import conditional
 from profile.serializers import UserProfileSerializer, UserProfileUpdateSerializer
-from stock.serializers import ProductStockSerializer, RawStockSerializer
+from stock.serializers import (
+    ProductStockSerializer,
+    ProductStockTotalSerializer,
+    RawStockSerializer,
+)
 from product.serializers import (
     ProductSerializer,
     RawSerializer,
@@ -46,8 +68,17 @@ from product.serializers import (
     ProductAttrSerializer,
 )
 from system.serializers import DamagedProductSerializer, DamagedRawSerializer
-from stock.models import ProductStock, RawStock
-from product.models import Product, Raw, RawForProduction, ProductAttr
+from stock.models import ProductStock, ProductStockTotal, RawStock
+from stock.tools import InsufficientStockError, set_stock_count, stock_count_at
+from stock.importer import import_stock, read_rows
+from product.models import (
+    Product,
+    Raw,
+    RawForProduction,
+    ProductForProduction,
+    ProductAttr,
+)
+from product.bom import BOMCycleError
 from system.models import (
     Client,
     Supplier,
@@ -56,6 +87,9 @@ from system.models import (
     Budget,
     DamagedProduct,
     DamagedRaw,
+    MaterialRequirement,
+    StockAlert,
+    BudgetRollup,
 )
 from system.serializers import (
     ClientSerializer,
@@ -63,14 +97,34 @@ from system.serializers import (
     ProductOrderSerializer,
     RawOrderSerializer,
     BudgetSerializer,
-    BudgetTotalSerializer,
     BudgetDetailSerializer,
     ClientUpdateSerializer,
     SupplierUpdateSerializer,
+    MaterialRequirementSerializer,
+    StockAlertSerializer,
+    BudgetAccountSerializer,
+    BudgetRollupSerializer,
+)
+from system.planning import (
+    time_phased_plan,
+    parse_delivery_date,
+    load_snapshot,
+    check_feasibility,
+    suggest_raw_orders,
+    load_producible,
 )
+from system.simulation import simulate_many
+from system.events import stream
+from django.http import StreamingHttpResponse
+from system.constant import DAY, MONTH, AVERAGE, PLANNING_GRANULARITY, VALUATION_METHODS
+from system.valuation import inventory_valuation
+from system.ledger import load_account
 from profile.models import UserProfile
 from decimal import Decimal
 
+# Tables a serialized product is read from, for conditional GETs.
+PRODUCT_TABLES = (Product, ProductStock, RawForProduction, ProductForProduction, Raw, ProductAttr)
+
 
 @api_view(["POST"])
 @schema(
@@ -114,14 +168,19 @@ def login_view(request):
 
 @api_view(["GET"])
 @authentication_classes((TokenAuthentication,))
+@conditional(ProductStock)
 def list_product_stock_view(request):
     """
     API endpoint that return product stock names
     """
     if request.method == "GET":
         try:
-            product_stock = ProductStock.objects.all().order_by("-created_at")
-            product_stock_serializer = ProductStockSerializer(product_stock, many=True)
+            product_stock = load_related(
+                request, ProductStock.objects.all(), ProductStockSerializer
+            ).order_by("-created_at")
+            product_stock_serializer = ProductStockSerializer(
+                product_stock, many=True, context={"request": request}
+            )
             return Response(product_stock_serializer.data, status=status.HTTP_200_OK)
         except Exception as ex:
             print(str(ex))
@@ -131,6 +190,26 @@ def list_product_stock_view(request):
             )
 
 
+@api_view(["GET"])
+@authentication_classes((TokenAuthentication,))
+def list_product_stock_total_view(request):
+    """
+    API endpoint that return product stock counts summed by stock name
+    """
+    if request.method == "GET":
+        try:
+            totals = load_related(
+                request, ProductStockTotal.objects.all(), ProductStockTotalSerializer
+            ).order_by("name")
+            totals_serializer = ProductStockTotalSerializer(
+                totals, many=True, context={"request": request}
+            )
+            return Response(totals_serializer.data, status=status.HTTP_200_OK)
+        except Exception as ex:
+            print(str(ex))
+            return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+
 @api_view(["POST"])
 @authentication_classes((TokenAuthentication,))
 @schema(
@@ -169,6 +248,16 @@ class ProductStockUpdateAPIView(UpdateAPIView):
     lookup_field = "id"
     queryset = ProductStock.objects.all()
 
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            serializer.instance = ProductStock.objects.select_for_update().get(
+                id=serializer.instance.id
+            )
+            count = serializer.validated_data.pop("count", None)
+            stock = serializer.save()
+            if count is not None:
+                set_stock_count(ProductStock, stock, count)
+
 
 class ProductStockDeleteAPIView(DestroyAPIView):
     serializer_class = ProductStockSerializer
@@ -195,15 +284,20 @@ class ProductStockDeleteAPIView(DestroyAPIView):
 
 @api_view(["GET"])
 @authentication_classes((TokenAuthentication,))
+@conditional(RawStock)
 def list_raw_stock_view(request):
     """
     API endpoint that return raw stock names
     """
     if request.method == "GET":
         try:
-            raw_stock = RawStock.objects.all().order_by("-created_at")
+            raw_stock = load_related(
+                request, RawStock.objects.all(), RawStockSerializer
+            ).order_by("-created_at")
             if raw_stock.count() != 0:
-                raw_stock_serializer = RawStockSerializer(raw_stock, many=True)
+                raw_stock_serializer = RawStockSerializer(
+                    raw_stock, many=True, context={"request": request}
+                )
                 return Response(raw_stock_serializer.data, status=status.HTTP_200_OK)
             else:
                 return Response(
@@ -253,6 +347,16 @@ class RawStockUpdateAPIView(UpdateAPIView):
     lookup_field = "id"
     queryset = RawStock.objects.all()
 
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            serializer.instance = RawStock.objects.select_for_update().get(
+                id=serializer.instance.id
+            )
+            count = serializer.validated_data.pop("count", None)
+            stock = serializer.save()
+            if count is not None:
+                set_stock_count(RawStock, stock, count)
+
 
 class RawStockDeleteAPIView(DestroyAPIView):
     serializer_class = RawStockSerializer
@@ -279,15 +383,124 @@ class RawStockDeleteAPIView(DestroyAPIView):
 
 @api_view(["GET"])
 @authentication_classes((TokenAuthentication,))
+def list_stock_alert_view(request):
+    """
+    API endpoint that return raws and products at or below their reorder level
+    """
+    if request.method == "GET":
+        try:
+            alerts = StockAlert.objects.select_related("raw__stock", "product__stock")
+            alert_serializer = StockAlertSerializer(alerts, many=True)
+            return Response(alert_serializer.data, status=status.HTTP_200_OK)
+        except Exception as ex:
+            print(str(ex))
+            return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(["GET"])
+@authentication_classes((TokenAuthentication,))
+@schema(
+    StockValuationSchema,
+)
+def stock_valuation_view(request):
+    """
+    API endpoint that return raw and product inventory value at average or fifo cost
+    """
+    if request.method == "GET":
+        try:
+            method = request.GET.get("method", AVERAGE)
+            if method not in dict(VALUATION_METHODS):
+                return Response(
+                    {"detail": _("Method must be average or fifo.")},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            return Response(inventory_valuation(method), status=status.HTTP_200_OK)
+        except Exception as ex:
+            print(str(ex))
+            return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(["POST"])
+@authentication_classes((TokenAuthentication,))
+@schema(
+    ImportStockSchema,
+)
+def import_stock_view(request):
+    """
+    API endpoint that apply stock counts or deltas from an uploaded CSV or NDJSON file
+    """
+    try:
+        upload = request.FILES["file"]
+        fmt = request.data.get("format") or (
+            "csv" if upload.name.endswith(".csv") else "ndjson"
+        )
+        if fmt not in ("csv", "ndjson"):
+            return Response(
+                {"detail": _("Format must be csv or ndjson.")},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        text = io.TextIOWrapper(upload, encoding="utf-8", newline="")
+        return Response(import_stock(read_rows(text, fmt)), status=status.HTTP_200_OK)
+    except Exception as ex:
+        print(str(ex))
+        return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(["GET"])
+@authentication_classes((TokenAuthentication,))
+@schema(
+    StockAtSchema,
+)
+def stock_at_view(request):
+    """
+    API endpoint that return product or raw stock count at the given date
+    """
+    if request.method == "GET":
+        try:
+            if request.GET.get("product_stock_name"):
+                model, name = ProductStock, request.GET["product_stock_name"]
+            else:
+                model, name = RawStock, request.GET["raw_stock_name"]
+            stock = model.objects.get(name=name)
+            moment = timezone.now()
+            if request.GET.get("date"):
+                moment = parse_datetime(request.GET["date"])
+                if moment is None:
+                    moment = datetime.combine(parse_date(request.GET["date"]), time.max)
+                if timezone.is_naive(moment):
+                    moment = timezone.make_aware(moment)
+            return Response(
+                {
+                    "id": stock.id,
+                    "name": stock.name,
+                    "date": moment,
+                    "count": stock_count_at(model, stock.id, moment),
+                },
+                status=status.HTTP_200_OK,
+            )
+        except ObjectDoesNotExist:
+            return Response(
+                {"detail": _("Stock not found.")},
+                status=status.HTTP_404_NOT_FOUND,
+            )
+        except Exception as ex:
+            print(str(ex))
+            return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(["GET"])
+@authentication_classes((TokenAuthentication,))
+@schema(
+    PageSchema,
+)
+@conditional(*PRODUCT_TABLES)
 def list_all_product_info_view(request):
     """
     API endpoint that return all product and quantity
     """
     if request.method == "GET":
         try:
-            product_info = Product.objects.all().order_by("-created_at")
-            product_info_serializer = ProductSerializer(product_info, many=True)
-            return Response(product_info_serializer.data, status=status.HTTP_200_OK)
+            return paginate(request, Product.objects.all(), ProductSerializer)
         except Exception as ex:
             print(str(ex))
             return Response(
@@ -301,18 +514,22 @@ def list_all_product_info_view(request):
 @schema(
     ProductInfoSchema,
 )
+@conditional(*PRODUCT_TABLES)
 def list_product_info_view(request):
     """
     API endpoint that return product and quantity by product name
     """
     if request.method == "GET":
         try:
-            product_info = Product.objects.filter(
-                name=request.GET.get("product_name")
-            ).order_by("-created_at")
-            if product_info.count() != 0:
-                print(product_info)
-                product_info_serializer = ProductSerializer(product_info, many=True)
+            product_info = load_related(
+                request,
+                Product.objects.filter(name=request.GET.get("product_name")),
+                ProductSerializer,
+            )
+            if product_info:
+                product_info_serializer = ProductSerializer(
+                    product_info, many=True, context={"request": request}
+                )
                 return Response(product_info_serializer.data, status=status.HTTP_200_OK)
             else:
                 return Response(
@@ -324,6 +541,28 @@ def list_product_info_view(request):
             return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(["GET"])
+@authentication_classes((TokenAuthentication,))
+def list_producible_view(request):
+    """
+    API endpoint that return how many units of every product can be built from raw stock
+    """
+    if request.method == "GET":
+        try:
+            report = load_producible()
+            products = Product.objects.order_by("-created_at").values_list("id", "name")
+            return Response(
+                [
+                    {"id": product_id, "name": name, "producible": report.get(product_id)}
+                    for product_id, name in products
+                ],
+                status=status.HTTP_200_OK,
+            )
+        except Exception as ex:
+            print(str(ex))
+            return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+
 @api_view(["POST"])
 @authentication_classes((TokenAuthentication,))
 @schema(
@@ -342,6 +581,7 @@ def create_product_view(request):
             name=request.data["product_name"],
             unit_price=request.data["unit_price"],
             amount=request.data["amount"],
+            reorder_level=request.data.get("reorder_level", 0),
         )
         product.save()
         for attr in request.data.get("product_attr", []):
@@ -457,6 +697,47 @@ def create_product_template_view(request):
         return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(["POST"])
+@authentication_classes((TokenAuthentication,))
+@schema(
+    CreateProductAssemblySchema,
+)
+def create_product_assembly_view(request):
+    """
+    API endpoint that create product sub-assembly
+    """
+    try:
+        quantity = request.data["quantity"]
+        if int(quantity) > 0:
+            product = Product.objects.get(name=request.data["product_name"])
+            component = Product.objects.get(name=request.data["component_name"])
+            product_assembly = ProductForProduction(
+                product=product, component=component, quantity_for_prod=int(quantity)
+            )
+            product_assembly.save()
+            return Response(
+                {"detail": _("The product sub-assembly has been created successfully.")},
+                status=status.HTTP_200_OK,
+            )
+        else:
+            return Response(
+                {"detail": _("Enter the amount of product correctly.")},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+    except ObjectDoesNotExist:
+        return Response(
+            {"detail": _("The product was not found.")},
+            status=status.HTTP_404_NOT_FOUND,
+        )
+    except BOMCycleError:
+        return Response(
+            {"detail": _("This sub-assembly would create a cycle.")},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    except Exception as ex:
+        return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+
 class ProductTemplateUpdateAPIView(UpdateAPIView):
     serializer_class = RawForProdUpdateSerializer
     authentication_classes = (TokenAuthentication,)
@@ -513,17 +794,20 @@ class ProductTemplateDeleteAPIView(DestroyAPIView):
 @schema(
     RawInfoSchema,
 )
+@conditional(Raw, RawStock)
 def list_raw_info_view(request):
     """
     API endpoint that return raw and quantity by raw name
     """
     if request.method == "GET":
         try:
-            raw_info = Raw.objects.filter(name=request.GET.get("raw_name")).order_by(
-                "-created_at"
+            raw_info = load_related(
+                request, Raw.objects.filter(name=request.GET.get("raw_name")), RawSerializer
             )
-            if raw_info.count() != 0:
-                raw_info_serializer = RawSerializer(raw_info, many=True)
+            if raw_info:
+                raw_info_serializer = RawSerializer(
+                    raw_info, many=True, context={"request": request}
+                )
                 return Response(raw_info_serializer.data, status=status.HTTP_200_OK)
             else:
                 return Response(
@@ -537,15 +821,17 @@ def list_raw_info_view(request):
 
 @api_view(["GET"])
 @authentication_classes((TokenAuthentication,))
+@schema(
+    PageSchema,
+)
+@conditional(Raw, RawStock)
 def list_all_raw_info_view(request):
     """
     API endpoint that return all raw list
     """
     if request.method == "GET":
         try:
-            raw_info = Raw.objects.all().order_by("-created_at")
-            raw_info_serializer = RawSerializer(raw_info, many=True)
-            return Response(raw_info_serializer.data, status=status.HTTP_200_OK)
+            return paginate(request, Raw.objects.all(), RawSerializer)
         except Exception as ex:
             print(str(ex))
             return Response(
@@ -571,6 +857,7 @@ def create_raw_view(request):
             name=param["raw_name"],
             amount=param["amount"],
             unit_price=param["unit_price"],
+            reorder_level=param.get("reorder_level", 0),
         )
         raw.save()
         return Response(
@@ -631,21 +918,17 @@ class RawDeleteAPIView(DestroyAPIView):
 
 @api_view(["GET"])
 @authentication_classes((TokenAuthentication,))
+@schema(
+    PageSchema,
+)
+@conditional(Client)
 def list_client_view(request):
     """
     API endpoint that return client information
     """
     if request.method == "GET":
         try:
-            client = Client.objects.all().order_by("-created_at")
-            if client.count() != 0:
-                client_serializer = ClientSerializer(client, many=True)
-                return Response(client_serializer.data, status=status.HTTP_200_OK)
-            else:
-                return Response(
-                    {"detail": _("No customer has been created before.")},
-                    status=status.HTTP_200_OK,
-                )
+            return paginate(request, Client.objects.all(), ClientSerializer)
         except Exception as ex:
             print(str(ex))
             return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
@@ -716,21 +999,17 @@ class ClientDeleteAPIView(DestroyAPIView):
 
 @api_view(["GET"])
 @authentication_classes((TokenAuthentication,))
+@schema(
+    PageSchema,
+)
+@conditional(Supplier)
 def list_supplier_view(request):
     """
     API endpoint that return supplier information
     """
     if request.method == "GET":
         try:
-            supplier = Supplier.objects.all().order_by("-created_at")
-            if supplier.count() != 0:
-                supplier_serializer = SupplierSerializer(supplier, many=True)
-                return Response(supplier_serializer.data, status=status.HTTP_200_OK)
-            else:
-                return Response(
-                    {"detail": _("No suppliers have been created before.")},
-                    status=status.HTTP_200_OK,
-                )
+            return paginate(request, Supplier.objects.all(), SupplierSerializer)
         except Exception as ex:
             print(str(ex))
             return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
@@ -801,29 +1080,17 @@ class SupplierDeleteAPIView(DestroyAPIView):
 
 @api_view(["GET"])
 @authentication_classes((TokenAuthentication,))
+@schema(
+    PageSchema,
+)
+@conditional(ProductOrder, Client, *PRODUCT_TABLES)
 def list_product_order_view(request):
     """
     API endpoint that return product order information
     """
     if request.method == "GET":
         try:
-            product_order = (
-                ProductOrder.objects.filter()
-                .select_related("product", "client", "personal")
-                .order_by()
-            )
-            if product_order.exists():
-                product_order_serializer = ProductOrderSerializer(
-                    product_order, many=True
-                )
-                return Response(
-                    product_order_serializer.data, status=status.HTTP_200_OK
-                )
-            else:
-                return Response(
-                    {"detail": _("No product order has been created before.")},
-                    status=status.HTTP_200_OK,
-                )
+            return paginate(request, ProductOrder.objects.all(), ProductOrderSerializer)
         except Exception as ex:
             print(str(ex))
             return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
@@ -862,7 +1129,8 @@ def create_product_order_view(request):  # Testing doesnt not yet.
                 order_title=request.data["order_title"],
                 delivery_date=delivery_data,
             )
-        product_order.save()
+        with transaction.atomic():
+            product_order.save()
         return Response(
             {"detail": _("The product order was created successfully.")},
             status=status.HTTP_200_OK,
@@ -879,6 +1147,36 @@ def create_product_order_view(request):  # Testing doesnt not yet.
         )
 
 
+@api_view(["POST"])
+@authentication_classes((TokenAuthentication,))
+@schema(
+    ProductOrderFeasibilitySchema,
+)
+def product_order_feasibility_view(request):
+    """
+    API endpoint that check if product orders can be fulfilled without creating them
+    """
+    try:
+        items = request.data.get("items") or [
+            {
+                "product_name": request.data["product_name"],
+                "quantity": request.data["quantity"],
+            }
+        ]
+        items = [
+            (item["product_name"], Decimal(str(item["quantity"]))) for item in items
+        ]
+        return Response(
+            check_feasibility(items, load_snapshot()), status=status.HTTP_200_OK
+        )
+    except Exception as ex:
+        print(str(ex))
+        return Response(
+            {"detail": _("Enter the product names and quantities correctly.")},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+
 class ProductOrderUpdateAPIView(UpdateAPIView):
     serializer_class = ProductOrderSerializer
     authentication_classes = (TokenAuthentication,)
@@ -891,6 +1189,15 @@ class ProductOrderUpdateAPIView(UpdateAPIView):
     lookup_field = "id"
     queryset = ProductOrder.objects.all()
 
+    def perform_update(self, serializer):
+        try:
+            with transaction.atomic():
+                serializer.save()
+        except InsufficientStockError:
+            raise ValidationError(
+                {"detail": _("There is not enough raw materials in the warehouse.")}
+            )
+
 
 class ProductOrderDeleteAPIView(DestroyAPIView):
     serializer_class = ProductOrderSerializer
@@ -921,25 +1228,17 @@ class ProductOrderDeleteAPIView(DestroyAPIView):
 
 @api_view(["GET"])
 @authentication_classes((TokenAuthentication,))
+@schema(
+    PageSchema,
+)
+@conditional(RawOrder, Supplier, Raw, RawStock)
 def list_raw_order_view(request):
     """
     API endpoint that return raw order information
     """
     if request.method == "GET":
         try:
-            raw_order = (
-                RawOrder.objects.filter()
-                .select_related("supplier", "personal", "raw")
-                .order_by("-created_at")
-            )
-            if raw_order.exists():
-                raw_order_serializer = RawOrderSerializer(raw_order, many=True)
-                return Response(raw_order_serializer.data, status=status.HTTP_200_OK)
-            else:
-                return Response(
-                    {"detail": _("No material order has been created before.")},
-                    status=status.HTTP_200_OK,
-                )
+            return paginate(request, RawOrder.objects.all(), RawOrderSerializer)
         except Exception as ex:
             print(str(ex))
             return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
@@ -978,7 +1277,8 @@ def create_raw_order_view(request):  # Testing doesnt not yet.
                 order_title=request.data["order_title"],
                 delivery_date=delivery_data,
             )
-        raw_order.save()
+        with transaction.atomic():
+            raw_order.save()
         return Response(
             {"detail": _("The supplier was successfully created.")},
             status=status.HTTP_200_OK,
@@ -994,6 +1294,31 @@ def create_raw_order_view(request):  # Testing doesnt not yet.
         )
 
 
+@api_view(["POST"])
+@authentication_classes((TokenAuthentication,))
+def suggest_raw_order_view(request):
+    """
+    API endpoint that create waiting raw orders for the raw materials open product orders lack
+    """
+    try:
+        result = suggest_raw_orders(personal=request.user)
+        return Response(
+            {
+                "detail": _("Purchase suggestions were created successfully."),
+                "created": result["created"],
+                "skipped": list(
+                    Raw.objects.filter(id__in=result["skipped"]).values_list(
+                        "name", flat=True
+                    )
+                ),
+            },
+            status=status.HTTP_200_OK,
+        )
+    except Exception as ex:
+        print(str(ex))
+        return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+
 class RawOrderUpdateAPIView(UpdateAPIView):
     serializer_class = RawOrderSerializer
     authentication_classes = (TokenAuthentication,)
@@ -1009,7 +1334,8 @@ class RawOrderUpdateAPIView(UpdateAPIView):
     def update(self, request, *args, **kwargs):
         raw_order = self.get_object()
         if raw_order.status != request.data["status"]:
-            super().update(request, *args, **kwargs)
+            with transaction.atomic():
+                super().update(request, *args, **kwargs)
             return Response(
                 {"detail": "The order status was changed successfully."},
                 status=status.HTTP_200_OK,
@@ -1240,11 +1566,10 @@ def budget_total_view(request):
     API endpoint that return total money on system
     """
     if request.method == "GET":
-        budget = Budget.objects.filter()
         try:
-            if budget.exists():
-                budget = budget.first()
-                budget_serializer = BudgetTotalSerializer(budget, many=False)
+            account = load_account()
+            if account is not None:
+                budget_serializer = BudgetAccountSerializer(account, many=False)
                 return Response(budget_serializer.data, status=status.HTTP_200_OK)
             else:
                 return Response(
@@ -1258,22 +1583,17 @@ def budget_total_view(request):
 
 @api_view(["GET"])
 @authentication_classes((TokenAuthentication,))
+@schema(
+    PageSchema,
+)
+@conditional(Budget, ProductOrder, RawOrder, Client, Supplier, RawStock, *PRODUCT_TABLES)
 def budget_detail_total_view(request):
     """
-    API endpoint that return total money on system
+    API endpoint that return budget rows with their orders, one page at a time
     """
     if request.method == "GET":
-        budget = Budget.objects.filter()
         try:
-            if budget.exists():
-                budget = budget.all()
-                budget_serializer = BudgetDetailSerializer(budget, many=True)
-                return Response(budget_serializer.data, status=status.HTTP_200_OK)
-            else:
-                return Response(
-                    {"detail": _("Budget information not found.")},
-                    status=status.HTTP_200_OK,
-                )
+            return paginate(request, Budget.objects.all(), BudgetDetailSerializer)
         except Exception as ex:
             print(str(ex))
             return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
@@ -1281,23 +1601,18 @@ def budget_detail_total_view(request):
 
 @api_view(["GET"])
 @authentication_classes((TokenAuthentication,))
+@schema(
+    PageSchema,
+)
+@conditional(Budget)
 def budget_income_detail_and_total_view(request):
     """
     API endpoint that return total income money on system
     """
     if request.method == "GET":  # Total money receiver should be appended to model
         try:
-            budget = Budget.objects.exclude(product_order__isnull=True).order_by(
-                "-created_at"
-            )
-            if budget.exists():
-                budget_serializer = BudgetSerializer(budget, many=True)
-                return Response(budget_serializer.data, status=status.HTTP_200_OK)
-            else:
-                return Response(
-                    {"detail": _("Budget information not found.")},
-                    status=status.HTTP_200_OK,
-                )
+            budget = Budget.objects.exclude(product_order__isnull=True)
+            return paginate(request, budget, BudgetSerializer)
         except Exception as ex:
             print(str(ex))
             return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
@@ -1305,28 +1620,146 @@ def budget_income_detail_and_total_view(request):
 
 @api_view(["GET"])
 @authentication_classes((TokenAuthentication,))
+@schema(
+    PageSchema,
+)
+@conditional(Budget)
 def budget_outcome_detail_and_total_view(request):
     """
     API endpoint that return total outcome money on system
     """
     if request.method == "GET":  # Total money receiver should be appended to model
         try:
-            budget = Budget.objects.exclude(raw_order__isnull=True).order_by(
-                "-created_at"
-            )
-            if budget.exists():
-                budget_serializer = BudgetSerializer(budget, many=True)
-                return Response(budget_serializer.data, status=status.HTTP_200_OK)
-            else:
+            budget = Budget.objects.exclude(raw_order__isnull=True)
+            return paginate(request, budget, BudgetSerializer)
+        except Exception as ex:
+            print(str(ex))
+            return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(["GET"])
+@authentication_classes((TokenAuthentication,))
+@schema(
+    BudgetRollupSchema,
+)
+def budget_rollup_view(request):
+    """
+    API endpoint that return income, expense, salaries and net per day or month
+    """
+    if request.method == "GET":
+        try:
+            granularity = request.GET.get("granularity", MONTH)
+            if granularity not in (DAY, MONTH):
                 return Response(
-                    {"detail": _("Budget information not found.")},
-                    status=status.HTTP_200_OK,
+                    {"detail": _("Granularity must be day or month.")},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            rollup = BudgetRollup.objects.filter(granularity=granularity)
+            if request.GET.get("from"):
+                rollup = rollup.filter(period__gte=parse_date(request.GET["from"]))
+            if request.GET.get("to"):
+                rollup = rollup.filter(period__lte=parse_date(request.GET["to"]))
+            rollup_serializer = BudgetRollupSerializer(rollup, many=True)
+            return Response(rollup_serializer.data, status=status.HTTP_200_OK)
+        except Exception as ex:
+            print(str(ex))
+            return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(["GET"])
+@authentication_classes((TokenAuthentication,))
+def list_material_requirement_view(request):
+    """
+    API endpoint that return raw material requirements of the last MRP run
+    """
+    if request.method == "GET":
+        try:
+            requirement = MaterialRequirement.objects.select_related("raw__stock")
+            requirement_serializer = MaterialRequirementSerializer(requirement, many=True)
+            return Response(requirement_serializer.data, status=status.HTTP_200_OK)
+        except Exception as ex:
+            print(str(ex))
+            return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(["GET"])
+@authentication_classes((TokenAuthentication,))
+@schema(
+    TimePhasedPlanSchema,
+)
+def time_phased_plan_view(request):
+    """
+    API endpoint that return projected on hand and net requirement per raw by day or week
+    """
+    if request.method == "GET":
+        try:
+            granularity = request.GET.get("granularity", DAY)
+            if granularity not in dict(PLANNING_GRANULARITY):
+                return Response(
+                    {"detail": _("Granularity must be day or week.")},
+                    status=status.HTTP_400_BAD_REQUEST,
                 )
+            buckets = min(int(request.GET.get("buckets", 12)), 366)
+            start = parse_delivery_date(request.GET.get("start"))
+            plan = time_phased_plan(start, max(buckets, 1), granularity)
+            names = dict(
+                Raw.objects.filter(id__in=plan["raws"]).values_list("id", "name")
+            )
+            return Response(
+                {
+                    "buckets": plan["buckets"],
+                    "raws": [
+                        dict(raw=raw_id, name=names.get(raw_id), **phases)
+                        for raw_id, phases in plan["raws"].items()
+                    ],
+                },
+                status=status.HTTP_200_OK,
+            )
         except Exception as ex:
             print(str(ex))
             return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(["POST"])
+@authentication_classes((TokenAuthentication,))
+@schema(
+    SimulationSchema,
+)
+def simulation_view(request):
+    """
+    API endpoint that run what-if scenarios against current stock and budget without saving
+    """
+    try:
+        scenarios = request.data.get("scenarios") or [request.data]
+        return Response(
+            {"results": simulate_many(scenarios)}, status=status.HTTP_200_OK
+        )
+    except KeyError as ex:
+        return Response(
+            {"detail": _("Product or raw material not found: ") + str(ex)},
+            status=status.HTTP_404_NOT_FOUND,
+        )
+    except Exception as ex:
+        print(str(ex))
+        return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(["GET"])
+@authentication_classes((TokenAuthentication,))
+def events_stream_view(request):
+    """
+    API endpoint that stream stock and order changes as server-sent events
+    """
+    types = request.GET.get("types")
+    response = StreamingHttpResponse(
+        stream(set(types.split(",")) if types else None),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
 class ControlSecretAnswer(UpdateAPIView):
     serializer_class = UserProfileUpdateSerializer
     http_method_names = [
@@ -1386,15 +1819,17 @@ class NotAuthenticatedControlSecretAnswer(UpdateAPIView):
 
 @api_view(["GET"])
 @authentication_classes((TokenAuthentication,))
+@schema(
+    PageSchema,
+)
+@conditional(UserProfile)
 def get_all_user(request):
     """
     API endpoint that return all users
     """
     if request.method == "GET":
         try:
-            users = UserProfile.objects.filter()
-            serialized_users = UserProfileSerializer(users, many=True)
-            return Response(serialized_users.data, status=status.HTTP_200_OK)
+            return paginate(request, UserProfile.objects.all(), UserProfileSerializer)
         except Exception as ex:
             print(str(ex))
             return Response({"detail": str(ex)}, status=status.HTTP_400_BAD_REQUEST)
@@ -56,12 +56,74 @@ CELERY_BEAT_SCHEDULE = {
         "task": "system.tasks.task_pay_salaries",
         "schedule": crontab(minute=0, hour=0, day_of_month=1),
     },
+    "task_run_mrp": {
+        "task": "system.tasks.task_run_mrp",
+        "schedule": crontab(minute="*/15"),
+    },
+    "task_suggest_raw_orders": {
+        "task": "system.tasks.task_suggest_raw_orders",
+        "schedule": crontab(minute=0),
+    },
+    "task_release_reservations": {
+        "task": "system.tasks.task_release_reservations",
+        "schedule": crontab(minute="*/5"),
+    },
+    "task_snapshot_stock": {
+        "task": "stock.tasks.task_snapshot_stock",
+        "schedule": crontab(minute=0, hour="*/6"),
+    },
+    "task_check_product_stock_totals": {
+        "task": "stock.tasks.task_check_product_stock_totals",
+        "schedule": crontab(minute=30, hour=3),
+    },
+    "task_check_budget_totals": {
+        "task": "system.tasks.task_check_budget_totals",
+        "schedule": crontab(minute=0, hour=4),
+    },
     "task_test": {
         "task": "netplas.celery.debug_task",
         "schedule": crontab(minute="*/3"),
     },
 }
 
+# Seconds a worker may answer planning questions from its stock snapshot.
+PLANNING_SNAPSHOT_TIMEOUT = 10
+
+# Seconds before the max producible report is rebuilt from scratch. Stock
+# changes refresh it in between, but only in the cache of the worker that
+# made them unless a shared cache backend is configured.
+PRODUCIBLE_REPORT_TIMEOUT = 300
+
+# Seconds a WAITING product order holds its raw materials before the
+# sweeper releases them and marks the order FAIL.
+STOCK_RESERVATION_TTL = 60 * 60 * 24 * 7
+
+# Rows applied per transaction by the stock import.
+STOCK_IMPORT_CHUNK_SIZE = 2000
+
+# Budget rows rewritten per bulk update by the budget rebuild.
+BUDGET_REBUILD_CHUNK_SIZE = 2000
+
+# Rows per page of paginated list endpoints, and the most a client may ask
+# for with ?page_size=.
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+
+# Redis URL that carries live stock and order events between workers. With
+# None, events/stream only sees changes made by its own process.
+EVENT_BUS_URL = CELERY_BROKER_URL
+
+# Events buffered per open stream before it is told to reload instead.
+EVENT_QUEUE_SIZE = 1000
+
+# Seconds between keep-alive comments, and before a stream is closed so the
+# client reconnects and the worker is freed.
+EVENT_STREAM_HEARTBEAT = 15
+EVENT_STREAM_MAX_AGE = 300
+
+# Processes used to run what-if scenario batches, None for one per CPU.
+SIMULATION_WORKERS = None
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
         "rest_framework.authentication.TokenAuthentication",
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from product.models import Product, Raw, RawForProduction, ProductAttr
+from product.models import Product, Raw, RawForProduction, ProductForProduction, ProductAttr
 
 
 class RawForProdAdmin(admin.ModelAdmin):
@@ -16,6 +16,12 @@ class RawForProdAdmin(admin.ModelAdmin):
     autocomplete_fields =['product', 'raw']
 
 
+class ProductForProdAdmin(admin.ModelAdmin):
+    list_display = ('id', 'product', 'component', 'quantity_for_prod', 'created_at', )
+    search_fields = ('product__name', 'component__name')
+    autocomplete_fields =['product', 'component']
+
+
 class ProductAdmin(admin.ModelAdmin):
     def suit_row_attributes(self, obj, request):
         css_class = {
@@ -45,6 +51,7 @@ class RawAdmin(admin.ModelAdmin):
 
 
 admin.site.register(RawForProduction, RawForProdAdmin)
+admin.site.register(ProductForProduction, ProductForProdAdmin)
 admin.site.register(Product, ProductAdmin)
 admin.site.register(Raw, RawAdmin)
 admin.site.register(ProductAttr)
@@ -0,0 +1,199 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction
+from product.models import Product, ProductForProduction, RawForProduction, FlatRecipe
+
+
+class BOMCycleError(Exception):
+    pass
+
+
+class BOM(object):
+    """
+    Multi-level bill of materials.
+
+    `components` maps a product id to its sub-assemblies and `raws` maps a
+    product id to its raw materials, both as lists of (id, quantity) pairs.
+    """
+
+    def __init__(self, components, raws):
+        self.components = components
+        self.raws = raws
+
+    @classmethod
+    def load(cls, product_ids=None):
+        """
+        Load the recipes of the given products and all of their sub-assemblies,
+        one query per BOM level. Load the whole catalog if no ids are given.
+        """
+        components = defaultdict(list)
+        assemblies = ProductForProduction.objects.order_by().values_list(
+            "product_id", "component_id", "quantity_for_prod"
+        )
+        recipes = RawForProduction.objects.order_by().values_list(
+            "product_id", "raw_id", "quantity_for_prod"
+        )
+        if product_ids is None:
+            for product_id, component_id, quantity in assemblies:
+                components[product_id].append((component_id, quantity))
+        else:
+            seen = set(product_ids)
+            frontier = set(product_ids)
+            while frontier:
+                rows = assemblies.filter(product_id__in=frontier)
+                frontier = set()
+                for product_id, component_id, quantity in rows:
+                    components[product_id].append((component_id, quantity))
+                    if component_id not in seen:
+                        seen.add(component_id)
+                        frontier.add(component_id)
+            recipes = recipes.filter(product_id__in=seen)
+        raws = defaultdict(list)
+        for product_id, raw_id, quantity in recipes:
+            raws[product_id].append((raw_id, quantity))
+        return cls(dict(components), dict(raws))
+
+    def reachable(self, product_ids):
+        """
+        Return every product consumed directly or indirectly by the given ones.
+        """
+        seen = set(product_ids)
+        stack = list(seen)
+        while stack:
+            for component_id, quantity in self.components.get(stack.pop(), ()):
+                if component_id not in seen:
+                    seen.add(component_id)
+                    stack.append(component_id)
+        return seen
+
+    def order(self, product_ids):
+        """
+        Topologically sort the products reachable from the given ones so that
+        every assembly comes before its sub-assemblies.
+        """
+        nodes = self.reachable(product_ids)
+        indegree = dict.fromkeys(nodes, 0)
+        for product_id in nodes:
+            for component_id, quantity in self.components.get(product_id, ()):
+                indegree[component_id] += 1
+        ready = [product_id for product_id in nodes if not indegree[product_id]]
+        ordered = []
+        while ready:
+            product_id = ready.pop()
+            ordered.append(product_id)
+            for component_id, quantity in self.components.get(product_id, ()):
+                indegree[component_id] -= 1
+                if not indegree[component_id]:
+                    ready.append(component_id)
+        if len(ordered) != len(nodes):
+            cycle = sorted(product_id for product_id in nodes if indegree[product_id])
+            raise BOMCycleError("The BOM has a cycle between products {}.".format(cycle))
+        return ordered
+
+    def flatten(self, product_ids):
+        """
+        Return {product_id: {raw_id: quantity}} per unit of each given product,
+        flattening every sub-assembly once, bottom-up.
+        """
+        flat = {}
+        for product_id in reversed(self.order(product_ids)):
+            raws = defaultdict(int)
+            for raw_id, quantity in self.raws.get(product_id, ()):
+                raws[raw_id] += quantity
+            for component_id, quantity in self.components.get(product_id, ()):
+                for raw_id, per_unit in flat[component_id].items():
+                    raws[raw_id] += quantity * per_unit
+            flat[product_id] = dict(raws)
+        return {product_id: flat[product_id] for product_id in product_ids}
+
+    def gross_requirements(self, demand):
+        """
+        Propagate {product_id: quantity} demand down to every sub-assembly.
+        """
+        gross = defaultdict(Decimal)
+        for product_id, quantity in demand.items():
+            gross[product_id] += Decimal(quantity)
+        for product_id in self.order(demand):
+            quantity = gross[product_id]
+            for component_id, per_unit in self.components.get(product_id, ()):
+                gross[component_id] += quantity * per_unit
+        return dict(gross)
+
+    def explode(self, demand):
+        """
+        Return the {raw_id: quantity} needed to build {product_id: quantity}.
+        """
+        requirements = defaultdict(Decimal)
+        for product_id, quantity in self.gross_requirements(demand).items():
+            for raw_id, per_unit in self.raws.get(product_id, ()):
+                requirements[raw_id] += quantity * per_unit
+        return dict(requirements)
+
+
+def explode(product_id, quantity):
+    return BOM.load([product_id]).explode({product_id: quantity})
+
+
+def creates_cycle(product_id, component_id):
+    """
+    Whether making `component_id` a sub-assembly of `product_id` closes a loop.
+    """
+    if product_id == component_id:
+        return True
+    return product_id in BOM.load([component_id]).reachable([component_id])
+
+
+def assemblies_of(product_ids):
+    """
+    Return the given products and every assembly that consumes them.
+    """
+    seen = set(product_ids)
+    frontier = set(product_ids)
+    while frontier:
+        frontier = set(
+            ProductForProduction.objects.filter(component_id__in=frontier)
+            .order_by()
+            .values_list("product_id", flat=True)
+        ) - seen
+        seen |= frontier
+    return seen
+
+
+def rebuild_flat_recipes(product_ids=None):
+    """
+    Recompute the FlatRecipe rows of the given products and of every assembly
+    that uses them, or of the whole catalog if no ids are given.
+    """
+    if product_ids is None:
+        products = set(Product.objects.values_list("id", flat=True))
+        flat = BOM.load().flatten(products)
+        rows = FlatRecipe.objects.all()
+    else:
+        products = assemblies_of(product_ids)
+        flat = BOM.load(products).flatten(products)
+        rows = FlatRecipe.objects.filter(product_id__in=products)
+    with transaction.atomic():
+        rows.delete()
+        FlatRecipe.objects.bulk_create(
+            [
+                FlatRecipe(product_id=product_id, raw_id=raw_id, quantity_for_prod=quantity)
+                for product_id, raws in flat.items()
+                for raw_id, quantity in raws.items()
+            ],
+            batch_size=1000,
+        )
+
+
+def load_flat_recipes(product_ids=None):
+    """
+    Return {product_id: {raw_id: quantity}} read from the FlatRecipe table.
+    """
+    rows = FlatRecipe.objects.order_by().values_list(
+        "product_id", "raw_id", "quantity_for_prod"
+    )
+    if product_ids is not None:
+        rows = rows.filter(product_id__in=product_ids)
+    recipes = defaultdict(dict)
+    for product_id, raw_id, quantity in rows:
+        recipes[product_id][raw_id] = quantity
+    return dict(recipes)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from product.bom import rebuild_flat_recipes
+from product.models import Product
+from system.versions import bump_versions
+
+
+class Command(BaseCommand):
+    help = "Rebuild the flattened raw material recipe of every product."
+
+    def handle(self, *args, **options):
+        rebuild_flat_recipes()
+        # product responses embed the flattened recipe, so their ETags must change
+        bump_versions(Product)
+        self.stdout.write(self.style.SUCCESS("Flattened recipes rebuilt."))
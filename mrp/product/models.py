@@ -1,5 +1,8 @@
 from django.utils.translation import ugettext_lazy as _
 from django.db import models
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.core.exceptions import ValidationError
 from stock.models import ProductStock, RawStock
 from decimal import Decimal
 
@@ -23,6 +26,7 @@ class Raw(models.Model):
         decimal_places=2,
         max_digits=10,
     )
+    reorder_level = models.PositiveIntegerField(_("Reorder Level"), default=0)
     created_at = models.DateTimeField(
         _("Created Data"), auto_now_add=True, editable=False
     )
@@ -32,6 +36,7 @@ class Raw(models.Model):
         verbose_name = _("raw material")
         verbose_name_plural = _("raw materials")
         ordering = ("-created_at",)
+        indexes = [models.Index(fields=["created_at", "id"])]
 
     def __str__(self):
         return "{}".format(self.name)
@@ -53,6 +58,7 @@ class Product(models.Model):
         max_digits=10,
         default=Decimal(1),
     )
+    reorder_level = models.PositiveIntegerField(_("Reorder Level"), default=0)
     created_at = models.DateTimeField(
         _("Created Data"), auto_now_add=True, editable=False
     )
@@ -62,6 +68,7 @@ class Product(models.Model):
         verbose_name = _("Product")
         verbose_name_plural = _("Products")
         ordering = ("-created_at",)
+        indexes = [models.Index(fields=["created_at", "id"])]
 
     def __str__(self):
         return "{}".format(self.name)
@@ -97,6 +104,69 @@ class RawForProduction(models.Model):
         return "{}".format(self.product)
 
 
+class ProductForProduction(models.Model):
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        verbose_name=_("Product"),
+        related_name="components",
+    )
+    component = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        verbose_name=_("Sub-assembly"),
+        related_name="assemblies",
+    )
+    quantity_for_prod = models.IntegerField(
+        _("Quantity Required for Production"), default=1
+    )
+    created_at = models.DateTimeField(
+        _("Created Data"), auto_now_add=True, editable=False
+    )
+    updated_at = models.DateTimeField(_("Updated Date"), auto_now=True, editable=False)
+
+    class Meta:
+        verbose_name = _("Sub-assembly Quantities for Production")
+        verbose_name_plural = _("Sub-assembly Quantities for Production")
+        ordering = ("-created_at",)
+
+    def __str__(self):
+        return "{} - {}".format(self.product, self.component)
+
+    def clean(self):
+        from product.bom import creates_cycle
+
+        if creates_cycle(self.product_id, self.component_id):
+            raise ValidationError(_("This sub-assembly would create a cycle."))
+
+
+class FlatRecipe(models.Model):
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        verbose_name=_("Product"),
+        related_name="flat_raws",
+    )
+    raw = models.ForeignKey(
+        Raw,
+        on_delete=models.CASCADE,
+        verbose_name=_("Raw Material"),
+        related_name="flat_products",
+    )
+    quantity_for_prod = models.IntegerField(
+        _("Quantity Required for Production"), default=1
+    )
+    updated_at = models.DateTimeField(_("Updated Date"), auto_now=True, editable=False)
+
+    class Meta:
+        verbose_name = _("Flattened Raw Material Quantities for Production")
+        verbose_name_plural = _("Flattened Raw Material Quantities for Production")
+        unique_together = ("product", "raw")
+
+    def __str__(self):
+        return "{}".format(self.product)
+
+
 class ProductAttr(models.Model):
     product = models.ForeignKey(Product, related_name="attr", on_delete=models.CASCADE)
     name = models.CharField(max_length=100)
@@ -104,3 +174,46 @@ class ProductAttr(models.Model):
 
     def __str__(self):
         return f"{self.name} - {self.value}"
+
+
+@receiver(pre_save, sender=ProductForProduction)
+def check_bom_cycle(sender, instance, **kwargs):
+    from product.bom import BOMCycleError, creates_cycle
+
+    if creates_cycle(instance.product_id, instance.component_id):
+        raise BOMCycleError(
+            "Product {} cannot consume {}.".format(
+                instance.product_id, instance.component_id
+            )
+        )
+
+
+@receiver(pre_save, sender=RawForProduction)
+@receiver(pre_save, sender=ProductForProduction)
+def remember_recipe_product(sender, instance, **kwargs):
+    instance._old_product_id = (
+        sender.objects.filter(pk=instance.pk).values_list("product_id", flat=True).first()
+        if instance.pk
+        else None
+    )
+
+
+@receiver(post_save, sender=RawForProduction)
+@receiver(post_save, sender=ProductForProduction)
+@receiver(post_delete, sender=RawForProduction)
+@receiver(post_delete, sender=ProductForProduction)
+def update_flat_recipes(sender, instance, **kwargs):
+    from product.bom import rebuild_flat_recipes
+
+    product_ids = {instance.product_id, getattr(instance, "_old_product_id", None)}
+    rebuild_flat_recipes(product_ids - {None})
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_flat_recipes(sender, instance, **kwargs):
+    FlatRecipe.objects.filter(product_id=instance.id).delete()
+
+
+@receiver(post_delete, sender=Raw)
+def remove_raw_flat_recipes(sender, instance, **kwargs):
+    FlatRecipe.objects.filter(raw_id=instance.id).delete()
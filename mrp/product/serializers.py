@@ -1,24 +1,30 @@
 from rest_framework import serializers
+from django.db.models import Prefetch
 from django.template.defaultfilters import date as _date
-from product.models import Product, Raw, RawForProduction, ProductAttr
+from product.models import Product, Raw, RawForProduction, FlatRecipe, ProductAttr
 from stock.serializers import ProductStockSerializer, RawStockSerializer
+from api.v1.fieldsets import SparseFieldsMixin
 
 
 class RawUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Raw
-        fields = ('stock', 'name', 'amount', 'unit_price')
+        fields = ('stock', 'name', 'amount', 'unit_price', 'reorder_level')
 
 
-class RawSerializer(serializers.ModelSerializer):
+class RawSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     stock = RawStockSerializer(many=False, read_only=True)
     created_at = serializers.SerializerMethodField()
     updated_at = serializers.SerializerMethodField()
 
+    related = {
+        "stock": (("stock",), ()),
+    }
+
     class Meta:
         model = Raw
         fields = ("id", 'stock', 'name', 'amount',
-                  'created_at', 'updated_at', 'unit_price')
+                  'created_at', 'updated_at', 'unit_price', 'reorder_level')
 
     def get_created_at(self, obj):
         return _date(obj.created_at, "d F, Y - H:m")
@@ -59,27 +65,45 @@ class ExcludeProductRawForProdSerializer(serializers.ModelSerializer):
         fields = ("id", 'raw', 'quantity_for_prod', )
 
 
+class FlatRecipeSerializer(serializers.ModelSerializer):
+    raw = RawStockSerializer(many=False, read_only=True)
+
+    class Meta:
+        model = FlatRecipe
+        fields = ("id", 'raw', 'quantity_for_prod', )
+
+
 class ProductUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = ('stock', 'name', 'amount', 'unit_price')
+        fields = ('stock', 'name', 'amount', 'unit_price', 'reorder_level')
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     stock = ProductStockSerializer(many=False, read_only=True)
     raw_for_prod = serializers.SerializerMethodField()
+    flat_raw_for_prod = serializers.SerializerMethodField()
     created_at = serializers.SerializerMethodField()
     updated_at = serializers.SerializerMethodField()
     product_attr = serializers.SerializerMethodField()
 
+    related = {
+        "stock": (("stock",), ()),
+        "raw_for_prod": ((), (Prefetch("raws", RawForProduction.objects.select_related("raw")),)),
+        "flat_raw_for_prod": ((), (Prefetch("flat_raws", FlatRecipe.objects.select_related("raw")),)),
+        "product_attr": ((), ("attr",)),
+    }
+
     class Meta:
         model = Product
-        fields = ("id", 'stock', 'raw_for_prod', 'name',
-                  'amount', 'unit_price', 'created_at', 'updated_at', 'product_attr')
+        fields = ("id", 'stock', 'raw_for_prod', 'flat_raw_for_prod', 'name',
+                  'amount', 'unit_price', 'reorder_level', 'created_at', 'updated_at', 'product_attr')
 
     def get_raw_for_prod(self, obj):
-        raw_recipe = RawForProduction.objects.filter(product__name=obj.name)
-        return ExcludeProductRawForProdSerializer(raw_recipe, many=True).data
+        return ExcludeProductRawForProdSerializer(obj.raws.all(), many=True).data
+
+    def get_flat_raw_for_prod(self, obj):
+        return FlatRecipeSerializer(obj.flat_raws.all(), many=True).data
 
     def get_created_at(self, obj):
         return _date(obj.created_at, "d F, Y - H:m")
@@ -89,11 +113,11 @@ class ProductSerializer(serializers.ModelSerializer):
 
     def get_product_attr(self, obj):
         data = {}
-        for item in obj.attr.all().values_list('name', 'value', 'id'):
+        for attr in obj.attr.all():
             data.update(
                 {
-                    str(item[2]): {
-                        item[0]: item[1]
+                    str(attr.id): {
+                        attr.name: attr.value
                     }
                 }
             )
@@ -43,6 +43,7 @@ class UserProfile(AbstractBaseUser, PermissionsMixin):
         verbose_name = _("User")
         verbose_name_plural = _("Users")
         ordering = ("-created_at",)
+        indexes = [models.Index(fields=["created_at", "id"])]
 
     def __str__(self):
         return "{}".format(self.email)
@@ -1,9 +1,10 @@
 from django.template.defaultfilters import date as _date
 from rest_framework import serializers
 from profile.models import UserProfile
+from api.v1.fieldsets import SparseFieldsMixin
 
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     created_at = serializers.SerializerMethodField()
     updated_at = serializers.SerializerMethodField()
 
@@ -1,5 +1,13 @@
 from django.contrib import admin
-from stock.models import ProductStock, RawStock
+from stock.models import (
+    CostLayer,
+    ProductStock,
+    ProductStockTotal,
+    RawStock,
+    StockMovement,
+    StockSnapshot,
+    StockValuation,
+)
 
 
 class ProductStockAdmin(admin.ModelAdmin):
@@ -27,5 +35,32 @@ class RawStockAdmin(admin.ModelAdmin):
     search_fields = ('name',)
 
 
+class ProductStockTotalAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'count', 'updated_at')
+    search_fields = ('name',)
+
+
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('id', 'product_stock', 'raw_stock', 'delta', 'reason', 'created_at')
+    list_filter = ('reason',)
+
+
+class StockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('id', 'product_stock', 'raw_stock', 'count', 'created_at')
+
+
+class StockValuationAdmin(admin.ModelAdmin):
+    list_display = ('id', 'product_stock', 'raw_stock', 'quantity', 'average_value', 'fifo_value', 'updated_at')
+
+
+class CostLayerAdmin(admin.ModelAdmin):
+    list_display = ('id', 'product_stock', 'raw_stock', 'quantity', 'remaining', 'unit_cost', 'created_at')
+
+
 admin.site.register(ProductStock, ProductStockAdmin)
 admin.site.register(RawStock, RawStockAdmin)
+admin.site.register(ProductStockTotal, ProductStockTotalAdmin)
+admin.site.register(StockMovement, StockMovementAdmin)
+admin.site.register(StockSnapshot, StockSnapshotAdmin)
+admin.site.register(StockValuation, StockValuationAdmin)
+admin.site.register(CostLayer, CostLayerAdmin)
@@ -0,0 +1,13 @@
+PRODUCTION = "PRODUCTION"
+CONSUMPTION = "CONSUMPTION"
+RECEIPT = "RECEIPT"
+DAMAGE = "DAMAGE"
+ADJUSTMENT = "ADJUSTMENT"
+
+STOCK_MOVEMENT_REASON = (
+    (PRODUCTION, "PRODUCTION"),
+    (CONSUMPTION, "CONSUMPTION"),
+    (RECEIPT, "RECEIPT"),
+    (DAMAGE, "DAMAGE"),
+    (ADJUSTMENT, "ADJUSTMENT")
+)
@@ -0,0 +1,143 @@
+import csv
+import json
+from collections import defaultdict
+from itertools import islice
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from stock.constant import ADJUSTMENT
+from stock.models import ProductStock, RawStock
+from stock.tools import move_stock
+
+STOCK_MODELS = {"product": ProductStock, "raw": RawStock}
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+def read_rows(stream, fmt):
+    """
+    Yield (line, row) pairs from a text stream holding CSV with a header line
+    or one JSON object per line, without reading the whole stream.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line, text in enumerate(stream, 1):
+            if text.strip():
+                try:
+                    yield line, json.loads(text)
+                except ValueError as ex:
+                    yield line, ex
+
+
+def parse_row(row):
+    """
+    Return (model, name, count, delta) for a row with `type` (product or raw),
+    `name` and exactly one of `count` or `delta`.
+    """
+    if isinstance(row, Exception):
+        raise ImportRowError("Invalid JSON: {}".format(row))
+    if not isinstance(row, dict):
+        raise ImportRowError("Row must be an object.")
+    model = STOCK_MODELS.get(row.get("type") or "raw")
+    if model is None:
+        raise ImportRowError("type must be product or raw.")
+    name = row.get("name")
+    if not name:
+        raise ImportRowError("name is required.")
+    count, delta = row.get("count"), row.get("delta")
+    if (count in (None, "")) == (delta in (None, "")):
+        raise ImportRowError("Exactly one of count or delta is required.")
+    try:
+        if count not in (None, ""):
+            count = int(count)
+            if count < 0:
+                raise ImportRowError("count cannot be negative.")
+            return model, name, count, None
+        return model, name, None, int(delta)
+    except (TypeError, ValueError):
+        raise ImportRowError("count and delta must be integers.")
+
+
+def apply_chunk(chunk, errors):
+    """
+    Resolve the names of a chunk with one query per stock type, lock the
+    matching rows and apply every change with one move_stock per type.
+    Return the number of rows applied.
+    """
+    parsed = defaultdict(list)
+    for line, row in chunk:
+        try:
+            model, name, count, delta = parse_row(row)
+        except ImportRowError as ex:
+            errors.append({"line": line, "error": str(ex)})
+            continue
+        parsed[model].append((line, name, count, delta))
+    applied = 0
+    with transaction.atomic():
+        for model, rows in parsed.items():
+            fields = ["id", "name", "count"]
+            if model is RawStock:
+                fields.append("reserved")
+            stocks = {}
+            for stock in (
+                model.objects.select_for_update()
+                .filter(name__in={name for line, name, count, delta in rows})
+                .order_by("id")
+                .values(*fields)
+            ):
+                stocks.setdefault(stock["name"], []).append(stock)
+            deltas = {}
+            for line, name, count, delta in rows:
+                matches = stocks.get(name, ())
+                if len(matches) != 1:
+                    errors.append(
+                        {
+                            "line": line,
+                            "error": "Stock {} not found.".format(name)
+                            if not matches
+                            else "Stock name {} is ambiguous.".format(name),
+                        }
+                    )
+                    continue
+                stock = matches[0]
+                new_count = count if count is not None else stock["count"] + delta
+                if new_count < 0:
+                    errors.append({"line": line, "error": "Count cannot go below 0."})
+                    continue
+                if new_count < stock.get("reserved", 0):
+                    errors.append(
+                        {"line": line, "error": "Count cannot go below reserved stock."}
+                    )
+                    continue
+                deltas[stock["id"]] = deltas.get(stock["id"], 0) + new_count - stock["count"]
+                stock["count"] = new_count
+                applied += 1
+            move_stock(model, deltas, ADJUSTMENT)
+    return applied
+
+
+def import_stock(rows, chunk_size=None):
+    """
+    Apply (line, row) pairs from `read_rows` in chunks of STOCK_IMPORT_CHUNK_SIZE
+    rows, each in its own transaction, and return the row count, the applied
+    count and a per-row error report. A chunk the database rejects is reported
+    row by row and the import goes on with the next one.
+    """
+    chunk_size = chunk_size or settings.STOCK_IMPORT_CHUNK_SIZE
+    rows = iter(rows)
+    report = {"rows": 0, "applied": 0, "errors": []}
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return report
+        report["rows"] += len(chunk)
+        errors = []
+        try:
+            report["applied"] += apply_chunk(chunk, errors)
+        except DatabaseError as ex:
+            errors = [{"line": line, "error": str(ex)} for line, row in chunk]
+        report["errors"] += sorted(errors, key=lambda error: error["line"])
@@ -0,0 +1,25 @@
+import io
+import json
+import sys
+from django.core.management.base import BaseCommand
+from stock.importer import import_stock, read_rows
+
+
+class Command(BaseCommand):
+    help = "Apply stock counts or deltas from a CSV or NDJSON file in chunked transactions."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", help="CSV or NDJSON file, stdin if omitted")
+        parser.add_argument("--format", choices=("csv", "ndjson"), default=None)
+        parser.add_argument("--chunk-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["format"] or ("csv" if path and path.endswith(".csv") else "ndjson")
+        if path:
+            stream = open(path, newline="", encoding="utf-8")
+        else:
+            stream = io.TextIOWrapper(sys.stdin.buffer, newline="", encoding="utf-8")
+        with stream:
+            report = import_stock(read_rows(stream, fmt), options["chunk_size"])
+        self.stdout.write(json.dumps(report, indent=2))
@@ -1,12 +1,16 @@
 from django.utils.translation import ugettext_lazy as _
 from django.db import models
-from django.db.models import Sum
 from django.dispatch import receiver
-from django.db.models.signals import pre_save
+from django.db.models.signals import post_save, post_delete
+from decimal import Decimal
+from stock.constant import *
+from stock.signals import stock_changed
 
 
 class ProductStock(models.Model):
-    name = models.CharField(_("Name"), null=True, blank=True, max_length=150)
+    name = models.CharField(
+        _("Name"), null=True, blank=True, max_length=150, db_index=True
+    )
     count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(
         _("Created Data"), auto_now_add=True, editable=False
@@ -21,10 +25,32 @@ class ProductStock(models.Model):
     def __str__(self):
         return "{}".format(self.name)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # name and count as stored, so a save only moves the totals by the difference
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+
+class ProductStockTotal(models.Model):
+    name = models.CharField(_("Name"), unique=True, max_length=150)
+    count = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(_("Updated Date"), auto_now=True, editable=False)
+
+    class Meta:
+        verbose_name = _("Product Stock Total")
+        verbose_name_plural = _("Product Stock Totals")
+        ordering = ("name",)
+
+    def __str__(self):
+        return "{} {}".format(self.name, self.count)
+
 
 class RawStock(models.Model):
     name = models.CharField(_("Name"), null=True, blank=True, max_length=150)
     count = models.PositiveIntegerField(default=0)
+    reserved = models.PositiveIntegerField(_("Reserved"), default=0)
     created_at = models.DateTimeField(
         _("Created Data"), auto_now_add=True, editable=False
     )
@@ -38,15 +64,188 @@ class RawStock(models.Model):
     def __str__(self):
         return "{}".format(self.name)
 
+    @property
+    def available(self):
+        return self.count - self.reserved
+
+
+class StockMovement(models.Model):
+    product_stock = models.ForeignKey(
+        ProductStock,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        verbose_name=_("Product Stock"),
+        related_name="movements",
+    )
+    raw_stock = models.ForeignKey(
+        RawStock,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        verbose_name=_("Raw Material Stock"),
+        related_name="movements",
+    )
+    delta = models.IntegerField(_("Quantity Change"))
+    average_value = models.DecimalField(
+        _("Value at Average Cost"), decimal_places=2, max_digits=14, default=Decimal(0)
+    )
+    fifo_value = models.DecimalField(
+        _("Value at FIFO Cost"), decimal_places=2, max_digits=14, default=Decimal(0)
+    )
+    reason = models.CharField(
+        _("Reason"), choices=STOCK_MOVEMENT_REASON, default=ADJUSTMENT, max_length=150
+    )
+    created_at = models.DateTimeField(
+        _("Created Data"), auto_now_add=True, editable=False
+    )
+
+    class Meta:
+        verbose_name = _("Stock Movement")
+        verbose_name_plural = _("Stock Movements")
+        ordering = ("-created_at",)
+        indexes = [
+            models.Index(fields=["product_stock", "created_at"]),
+            models.Index(fields=["raw_stock", "created_at"]),
+        ]
+
+    def __str__(self):
+        return "{} {}".format(self.product_stock or self.raw_stock, self.delta)
+
+
+class StockSnapshot(models.Model):
+    product_stock = models.ForeignKey(
+        ProductStock,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        verbose_name=_("Product Stock"),
+        related_name="snapshots",
+    )
+    raw_stock = models.ForeignKey(
+        RawStock,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        verbose_name=_("Raw Material Stock"),
+        related_name="snapshots",
+    )
+    count = models.IntegerField(_("Count"))
+    created_at = models.DateTimeField(
+        _("Created Data"), auto_now_add=True, editable=False
+    )
+
+    class Meta:
+        verbose_name = _("Stock Snapshot")
+        verbose_name_plural = _("Stock Snapshots")
+        ordering = ("-created_at",)
+        indexes = [
+            models.Index(fields=["product_stock", "created_at"]),
+            models.Index(fields=["raw_stock", "created_at"]),
+        ]
+
+    def __str__(self):
+        return "{} {}".format(self.product_stock or self.raw_stock, self.count)
+
+
+class StockValuation(models.Model):
+    product_stock = models.OneToOneField(
+        ProductStock,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        verbose_name=_("Product Stock"),
+        related_name="valuation",
+    )
+    raw_stock = models.OneToOneField(
+        RawStock,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        verbose_name=_("Raw Material Stock"),
+        related_name="valuation",
+    )
+    quantity = models.IntegerField(_("Valued Quantity"), default=0)
+    average_value = models.DecimalField(
+        _("Value at Average Cost"), decimal_places=2, max_digits=14, default=Decimal(0)
+    )
+    fifo_value = models.DecimalField(
+        _("Value at FIFO Cost"), decimal_places=2, max_digits=14, default=Decimal(0)
+    )
+    updated_at = models.DateTimeField(_("Updated Date"), auto_now=True, editable=False)
+
+    class Meta:
+        verbose_name = _("Stock Valuation")
+        verbose_name_plural = _("Stock Valuations")
+
+    def __str__(self):
+        return "{} {}".format(self.product_stock or self.raw_stock, self.average_value)
+
+
+class CostLayer(models.Model):
+    product_stock = models.ForeignKey(
+        ProductStock,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        verbose_name=_("Product Stock"),
+        related_name="cost_layers",
+    )
+    raw_stock = models.ForeignKey(
+        RawStock,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        verbose_name=_("Raw Material Stock"),
+        related_name="cost_layers",
+    )
+    quantity = models.PositiveIntegerField(_("Received Quantity"))
+    remaining = models.PositiveIntegerField(_("Remaining Quantity"))
+    unit_cost = models.DecimalField(_("Unit Cost"), decimal_places=4, max_digits=14)
+    created_at = models.DateTimeField(
+        _("Created Data"), auto_now_add=True, editable=False
+    )
+
+    class Meta:
+        verbose_name = _("Cost Layer")
+        verbose_name_plural = _("Cost Layers")
+        ordering = ("id",)
+        indexes = [
+            models.Index(fields=["product_stock", "remaining"]),
+            models.Index(fields=["raw_stock", "remaining"]),
+        ]
 
-@receiver(pre_save, sender=ProductStock)  ###
-def set_product_stock_total(sender, instance, **kwargs):
-    try:
-        instance.count = (
-            instance.count
-            + ProductStock.objects.filter(name=instance.name).aggregate(Sum("count"))[
-                "count__sum"
-            ]
+    def __str__(self):
+        return "{} {}x{}".format(
+            self.product_stock or self.raw_stock, self.remaining, self.unit_cost
         )
-    except:
-        instance.count = 0
+
+
+@receiver(post_save, sender=ProductStock)
+def update_product_stock_total(sender, instance, created, **kwargs):
+    from stock.tools import add_product_stock_totals
+
+    loaded = getattr(instance, "_loaded_values", {})
+    add_product_stock_totals(
+        [
+            (loaded.get("name"), -loaded.get("count", 0)),
+            (instance.name, instance.count),
+        ]
+    )
+    instance._loaded_values = {"name": instance.name, "count": instance.count}
+
+
+@receiver(post_delete, sender=ProductStock)
+def remove_product_stock_total(sender, instance, **kwargs):
+    from stock.tools import add_product_stock_totals
+
+    loaded = getattr(instance, "_loaded_values", {})
+    add_product_stock_totals([(loaded.get("name"), -loaded.get("count", 0))])
+
+
+@receiver(stock_changed, sender=ProductStock)
+def move_product_stock_total(sender, deltas, **kwargs):
+    from stock.tools import add_product_stock_totals
+
+    names = ProductStock.objects.filter(id__in=deltas).values_list("id", "name")
+    add_product_stock_totals((name, deltas[stock_id]) for stock_id, name in names)
@@ -1,9 +1,10 @@
 from rest_framework import serializers
 from django.template.defaultfilters import date as _date
-from stock.models import ProductStock, RawStock
+from api.v1.fieldsets import SparseFieldsMixin
+from stock.models import ProductStock, ProductStockTotal, RawStock
 
 
-class ProductStockSerializer(serializers.ModelSerializer):
+class ProductStockSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     created_at = serializers.SerializerMethodField()
     updated_at = serializers.SerializerMethodField()
 
@@ -18,13 +19,24 @@ class ProductStockSerializer(serializers.ModelSerializer):
         return _date(obj.updated_at, "d F, Y - H:m")
 
 
-class RawStockSerializer(serializers.ModelSerializer):
+class ProductStockTotalSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    updated_at = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ProductStockTotal
+        fields = ('id', 'name', 'count', 'updated_at', )
+
+    def get_updated_at(self, obj):
+        return _date(obj.updated_at, "d F, Y - H:m")
+
+
+class RawStockSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     created_at = serializers.SerializerMethodField()
     updated_at = serializers.SerializerMethodField()
 
     class Meta:
         model = RawStock
-        fields = ('id', 'name', 'count', 'created_at', 'updated_at', )
+        fields = ('id', 'name', 'count', 'reserved', 'available', 'created_at', 'updated_at', )
 
     def get_created_at(self, obj):
         return _date(obj.created_at, "d F, Y - H:m")
@@ -0,0 +1,9 @@
+from django.dispatch import Signal
+
+# Sent by stock.tools.move_stock with sender set to ProductStock or RawStock
+# and deltas mapping each moved stock id to the quantity added to it.
+stock_changed = Signal(providing_args=["deltas"])
+
+# Sent by stock.tools.reserve_stock with sender set to RawStock and deltas
+# mapping each stock id to the quantity added to its reserved counter.
+stock_reserved = Signal(providing_args=["deltas"])
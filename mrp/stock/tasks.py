@@ -0,0 +1,16 @@
+from __future__ import absolute_import, unicode_literals
+from celery import task
+from stock.tools import take_snapshots, check_product_stock_totals
+
+
+@task()
+def task_snapshot_stock():
+    return take_snapshots()
+
+
+@task()
+def task_check_product_stock_totals():
+    return {
+        name: list(counts)
+        for name, counts in check_product_stock_totals(fix=True).items()
+    }
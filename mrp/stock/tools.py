@@ -0,0 +1,352 @@
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from stock.constant import ADJUSTMENT
+from stock.models import (
+    CostLayer,
+    ProductStock,
+    ProductStockTotal,
+    RawStock,
+    StockMovement,
+    StockSnapshot,
+    StockValuation,
+)
+from stock.signals import stock_changed, stock_reserved
+
+
+CENT = Decimal("0.01")
+
+
+class InsufficientStockError(IntegrityError):
+    pass
+
+
+def group_deltas(pairs):
+    """
+    Sum (stock_id, delta) pairs into {stock_id: delta}, dropping zero moves.
+    """
+    deltas = defaultdict(int)
+    for stock_id, delta in pairs:
+        deltas[stock_id] += delta
+    return {stock_id: int(delta) for stock_id, delta in deltas.items() if int(delta)}
+
+
+def stock_field(model):
+    return "product_stock" if model is ProductStock else "raw_stock"
+
+
+def move_stock(model, deltas, reason=ADJUSTMENT, costs=None):
+    """
+    Add {stock_id: delta} to the counts of a ProductStock or RawStock model
+    with a single atomic UPDATE, without reading the rows first, and record
+    the valued movements in the ledger with one bulk INSERT.
+
+    `costs` values receipts, see `value_stock`. Returns the
+    {stock_id: (average_value, fifo_value)} moved. The database rejects the
+    whole statement if any count would go negative.
+    """
+    deltas = group_deltas(deltas.items())
+    if not deltas:
+        return {}
+    field = stock_field(model)
+    with transaction.atomic():
+        model.objects.filter(id__in=deltas).update(
+            count=Case(
+                *[
+                    When(id=stock_id, then=F("count") + Value(delta))
+                    for stock_id, delta in deltas.items()
+                ],
+                default=F("count"),
+                output_field=IntegerField()
+            ),
+            updated_at=timezone.now(),
+        )
+        values = value_stock(model, deltas, costs)
+        StockMovement.objects.bulk_create(
+            [
+                StockMovement(
+                    delta=delta,
+                    reason=reason,
+                    average_value=values[stock_id][0],
+                    fifo_value=values[stock_id][1],
+                    **{field + "_id": stock_id}
+                )
+                for stock_id, delta in deltas.items()
+            ]
+        )
+    stock_changed.send(sender=model, deltas=deltas)
+    return values
+
+
+def set_stock_count(model, stock, count):
+    """
+    Bring a ProductStock or RawStock row, locked by the caller, to `count`
+    with an adjustment movement, so counts edited by hand are recorded in
+    the ledger and the valuation like any other move.
+    """
+    move_stock(model, {stock.id: count - stock.count}, ADJUSTMENT)
+    stock.count = count
+    return stock
+
+
+def load_valuations(model, deltas):
+    """
+    Lock the valuation rows of the moved stocks, opening missing ones with
+    the count held before this move as a zero cost layer.
+
+    The stock rows are already locked by the count UPDATE, so no other move
+    can open the same valuations concurrently.
+    """
+    field = stock_field(model)
+    locked = StockValuation.objects.select_for_update()
+    valuations = {
+        getattr(valuation, field + "_id"): valuation
+        for valuation in locked.filter(**{field + "_id__in": deltas})
+    }
+    missing = set(deltas) - set(valuations)
+    if not missing:
+        return valuations
+    openings = {
+        stock_id: max(count - deltas[stock_id], 0)
+        for stock_id, count in model.objects.filter(id__in=missing).values_list("id", "count")
+    }
+    StockValuation.objects.bulk_create(
+        [
+            StockValuation(quantity=opening, **{field + "_id": stock_id})
+            for stock_id, opening in openings.items()
+        ]
+    )
+    CostLayer.objects.bulk_create(
+        [
+            CostLayer(
+                quantity=opening,
+                remaining=opening,
+                unit_cost=Decimal(0),
+                **{field + "_id": stock_id}
+            )
+            for stock_id, opening in openings.items()
+            if opening
+        ]
+    )
+    valuations.update(
+        (getattr(valuation, field + "_id"), valuation)
+        for valuation in locked.filter(**{field + "_id__in": missing})
+    )
+    return valuations
+
+
+def value_stock(model, deltas, costs=None):
+    """
+    Keep the weighted average and FIFO valuation of the moved stocks in step
+    with {stock_id: delta} and return the {stock_id: (average_value,
+    fifo_value)} moved, negative for issues.
+
+    Receipts are valued at `costs` {stock_id: (average_value, fifo_value)}
+    when given and at the current average unit cost otherwise. Only the
+    valuation rows of the moved stocks and their open cost layers are read.
+    """
+    field = stock_field(model)
+    costs = costs or {}
+    valuations = load_valuations(model, deltas)
+    issued = issue_cost_layers(
+        field, {stock_id: -delta for stock_id, delta in deltas.items() if delta < 0}
+    )
+    values = {}
+    layers = []
+    now = timezone.now()
+    for stock_id, delta in deltas.items():
+        valuation = valuations[stock_id]
+        if delta > 0:
+            if stock_id in costs:
+                average, fifo = (
+                    Decimal(value).quantize(CENT, ROUND_HALF_UP) for value in costs[stock_id]
+                )
+            else:
+                average = fifo = (
+                    valuation.average_value * delta / valuation.quantity
+                    if valuation.quantity > 0
+                    else Decimal(0)
+                ).quantize(CENT, ROUND_HALF_UP)
+            layers.append(
+                CostLayer(
+                    quantity=delta,
+                    remaining=delta,
+                    unit_cost=fifo / delta,
+                    **{field + "_id": stock_id}
+                )
+            )
+            valuation.quantity += delta
+        else:
+            quantity = -delta
+            fifo = issued[stock_id]
+            if quantity >= valuation.quantity:
+                average, fifo = valuation.average_value, valuation.fifo_value
+            else:
+                average = (
+                    valuation.average_value * quantity / valuation.quantity
+                ).quantize(CENT, ROUND_HALF_UP)
+            valuation.quantity = max(valuation.quantity - quantity, 0)
+            average, fifo = -average, -fifo
+        valuation.average_value += average
+        valuation.fifo_value += fifo
+        valuation.updated_at = now
+        values[stock_id] = (average, fifo)
+    CostLayer.objects.bulk_create(layers)
+    StockValuation.objects.bulk_update(
+        valuations.values(), ["quantity", "average_value", "fifo_value", "updated_at"]
+    )
+    return values
+
+
+def issue_cost_layers(field, quantities):
+    """
+    Take {stock_id: quantity} units from the oldest open cost layers of each
+    stock and return the {stock_id: cost} taken, reading the open layers of
+    all the stocks with one query and writing them back with one UPDATE.
+    """
+    costs = {stock_id: Decimal(0) for stock_id in quantities}
+    if not quantities:
+        return costs
+    wanted = dict(quantities)
+    taken = []
+    open_layers = (
+        CostLayer.objects.select_for_update()
+        .filter(remaining__gt=0, **{field + "_id__in": quantities})
+        .order_by(field + "_id", "id")
+    )
+    for layer in open_layers:
+        stock_id = getattr(layer, field + "_id")
+        used = min(layer.remaining, wanted[stock_id])
+        if not used:
+            continue
+        layer.remaining -= used
+        wanted[stock_id] -= used
+        costs[stock_id] += used * layer.unit_cost
+        taken.append(layer)
+    CostLayer.objects.bulk_update(taken, ["remaining"])
+    return {stock_id: cost.quantize(CENT, ROUND_HALF_UP) for stock_id, cost in costs.items()}
+
+
+def reserve_stock(deltas):
+    """
+    Add {stock_id: quantity} to the reserved counters of RawStock rows with
+    one conditional UPDATE, so concurrent orders check availability without
+    locking the rows beyond that statement. Negative quantities release.
+
+    Raise InsufficientStockError and reserve nothing if any stock has less
+    available than asked for, or less reserved than released.
+    """
+    deltas = group_deltas(deltas.items())
+    if not deltas:
+        return deltas
+    condition = Q()
+    for stock_id, delta in deltas.items():
+        if delta > 0:
+            condition |= Q(id=stock_id, count__gte=F("reserved") + delta)
+        else:
+            condition |= Q(id=stock_id, reserved__gte=-delta)
+    with transaction.atomic():
+        updated = RawStock.objects.filter(condition).update(
+            reserved=Case(
+                *[
+                    When(id=stock_id, then=F("reserved") + Value(delta))
+                    for stock_id, delta in deltas.items()
+                ],
+                default=F("reserved"),
+                output_field=IntegerField()
+            ),
+            updated_at=timezone.now(),
+        )
+        if updated != len(deltas):
+            raise InsufficientStockError(
+                "Raw material stocks {} cannot cover the reservation.".format(sorted(deltas))
+            )
+    stock_reserved.send(sender=RawStock, deltas=deltas)
+    return deltas
+
+
+def take_snapshots():
+    """
+    Store the current count of every product and raw material stock, so
+    point-in-time queries only scan the ledger written since.
+    """
+    snapshots = [
+        StockSnapshot(product_stock_id=stock_id, count=count)
+        for stock_id, count in ProductStock.objects.order_by().values_list("id", "count")
+    ]
+    snapshots += [
+        StockSnapshot(raw_stock_id=stock_id, count=count)
+        for stock_id, count in RawStock.objects.order_by().values_list("id", "count")
+    ]
+    StockSnapshot.objects.bulk_create(snapshots, batch_size=1000)
+    return len(snapshots)
+
+
+def stock_count_at(model, stock_id, moment):
+    """
+    Return the count of a ProductStock or RawStock at `moment`: the latest
+    snapshot taken before it plus the ledger movements in between.
+
+    Counts set by hand rather than moved are only known from the next
+    snapshot on, so history before the first snapshot starts from zero.
+    """
+    lookup = {stock_field(model) + "_id": stock_id, "created_at__lte": moment}
+    snapshot = (
+        StockSnapshot.objects.filter(**lookup)
+        .order_by("-created_at")
+        .values_list("count", "created_at")
+        .first()
+    )
+    movements = StockMovement.objects.filter(**lookup)
+    count = 0
+    if snapshot is not None:
+        count, taken_at = snapshot
+        movements = movements.filter(created_at__gt=taken_at)
+    return count + (movements.aggregate(total=Sum("delta"))["total"] or 0)
+
+
+def add_product_stock_totals(pairs):
+    """
+    Add (name, delta) pairs to the ProductStockTotal rows, one UPDATE per
+    name, creating rows for names seen for the first time. Unnamed stocks
+    are not grouped.
+    """
+    for name, delta in group_deltas(pair for pair in pairs if pair[0]).items():
+        if ProductStockTotal.objects.filter(name=name).update(count=F("count") + delta):
+            continue
+        total, created = ProductStockTotal.objects.get_or_create(
+            name=name, defaults={"count": delta}
+        )
+        if not created:
+            ProductStockTotal.objects.filter(name=name).update(count=F("count") + delta)
+
+
+def check_product_stock_totals(fix=False):
+    """
+    Compare every ProductStockTotal with the sum of its product stocks and
+    return {name: (expected, recorded)} for the ones that differ, correcting
+    them by the difference if `fix` is set.
+    """
+    expected = dict(
+        ProductStock.objects.exclude(name__isnull=True)
+        .exclude(name="")
+        .order_by()
+        .values("name")
+        .annotate(total=Coalesce(Sum("count"), 0))
+        .values_list("name", "total")
+    )
+    recorded = dict(ProductStockTotal.objects.values_list("name", "count"))
+    mismatches = {
+        name: (expected.get(name, 0), recorded.get(name, 0))
+        for name in set(expected) | set(recorded)
+        if expected.get(name, 0) != recorded.get(name, 0)
+    }
+    if fix and mismatches:
+        add_product_stock_totals(
+            (name, count - recorded_count)
+            for name, (count, recorded_count) in mismatches.items()
+        )
+    return mismatches
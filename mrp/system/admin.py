@@ -1,5 +1,7 @@
 from django.contrib import admin
-from system.models import Client, Supplier, ProductOrder, RawOrder, Budget, Product, RawForProduction
+from system.models import Client, Supplier, ProductOrder, RawOrder, Budget, Product, RawForProduction, \
+    MaterialRequirement, OrderPlan, StockReservation, StockAlert, BudgetAccount, \
+    BudgetRollup, PayrollRun, Payslip, TableVersion
 
 
 class ClientAdmin(admin.ModelAdmin):
@@ -99,8 +101,76 @@ class BudgetAdmin(admin.ModelAdmin):
     autocomplete_fields =['product_order', 'raw_order']
 
 
+class MaterialRequirementAdmin(admin.ModelAdmin):
+    def suit_row_attributes(self, obj, request):
+        css_class = {
+            '0': 'success',
+            '1': 'error'
+        }
+        status = 1 if obj.net_requirement > 0 else 0
+        return {'class': css_class[str(status)]}
+
+    list_display = ('id', 'raw', 'gross_requirement', 'on_hand', 'net_requirement', 'updated_at', )
+    search_fields = ('raw__name', )
+
+
+class OrderPlanAdmin(admin.ModelAdmin):
+    def suit_row_attributes(self, obj, request):
+        css_class = {
+            '0': 'success',
+            '1': 'error'
+        }
+        status = 0 if obj.feasible else 1
+        return {'class': css_class[str(status)]}
+
+    list_display = ('id', 'product_order', 'feasible', 'shortage', 'updated_at', )
+    search_fields = ('product_order__product__name', )
+
+
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('id', 'product_order', 'raw_stock', 'quantity', 'expires_at', )
+    search_fields = ('raw_stock__name', )
+
+
+class StockAlertAdmin(admin.ModelAdmin):
+    list_display = ('id', 'raw', 'product', 'count', 'reorder_level', 'notified', 'created_at', )
+    list_filter = ('notified', )
+
+
+class BudgetAccountAdmin(admin.ModelAdmin):
+    list_display = ('id', 'total', 'updated_at', )
+
+
+class BudgetRollupAdmin(admin.ModelAdmin):
+    list_display = ('id', 'granularity', 'period', 'income', 'expense', 'salaries', 'net', )
+    list_filter = ('granularity', )
+
+
+class PayslipInline(admin.TabularInline):
+    model = Payslip
+    raw_id_fields = ('user', )
+    extra = 0
+
+
+class PayrollRunAdmin(admin.ModelAdmin):
+    list_display = ('id', 'period', 'employees', 'total', 'created_at', )
+    inlines = (PayslipInline, )
+
+
+class TableVersionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'name', 'version', 'updated_at', )
+
+
 admin.site.register(Client, ClientAdmin)
 admin.site.register(Supplier, SupplierAdmin)
 admin.site.register(ProductOrder, ProductOrderAdmin)
 admin.site.register(RawOrder, RawOrderAdmin)
 admin.site.register(Budget, BudgetAdmin)
+admin.site.register(MaterialRequirement, MaterialRequirementAdmin)
+admin.site.register(OrderPlan, OrderPlanAdmin)
+admin.site.register(StockReservation, StockReservationAdmin)
+admin.site.register(StockAlert, StockAlertAdmin)
+admin.site.register(BudgetAccount, BudgetAccountAdmin)
+admin.site.register(BudgetRollup, BudgetRollupAdmin)
+admin.site.register(PayrollRun, PayrollRunAdmin)
+admin.site.register(TableVersion, TableVersionAdmin)
@@ -0,0 +1,81 @@
+from django.core.mail import mail_admins
+from django.db import transaction
+from django.db.models import F
+from product.models import Product, Raw
+from stock.models import RawStock
+from system.models import StockAlert
+
+
+def check_stock_alerts(model, stock_ids):
+    """
+    Compare the raws or products kept in the given RawStock or ProductStock
+    rows with their reorder levels, opening an alert for every new breach and
+    closing the ones that recovered. Raws are measured on available stock.
+    Returns the number of alerts opened.
+    """
+    if model is RawStock:
+        field = "raw"
+        items = Raw.objects.annotate(available=F("stock__count") - F("stock__reserved"))
+    else:
+        field = "product"
+        items = Product.objects.annotate(available=F("stock__count"))
+    breached = {
+        item_id: (available, reorder_level)
+        for item_id, available, reorder_level in items.filter(
+            stock_id__in=stock_ids,
+            reorder_level__gt=0,
+            available__lte=F("reorder_level"),
+        )
+        .order_by()
+        .values_list("id", "available", "reorder_level")
+    }
+    alerts = {
+        getattr(alert, field + "_id"): alert
+        for alert in StockAlert.objects.filter(**{field + "__stock_id__in": stock_ids})
+    }
+    StockAlert.objects.filter(
+        id__in=[alert.id for item_id, alert in alerts.items() if item_id not in breached]
+    ).delete()
+    changed = []
+    for item_id, (available, reorder_level) in breached.items():
+        alert = alerts.get(item_id)
+        if alert and (alert.count, alert.reorder_level) != (available, reorder_level):
+            alert.count, alert.reorder_level = available, reorder_level
+            changed.append(alert)
+    StockAlert.objects.bulk_update(changed, ["count", "reorder_level"])
+    opened = [
+        StockAlert(count=available, reorder_level=reorder_level, **{field + "_id": item_id})
+        for item_id, (available, reorder_level) in breached.items()
+        if item_id not in alerts
+    ]
+    # a concurrent check may open the same alert first, one is enough
+    StockAlert.objects.bulk_create(opened, ignore_conflicts=True)
+    return len(opened)
+
+
+def deliver_stock_alerts():
+    """
+    Mail the admins about every alert not notified yet, once per breach.
+    """
+    with transaction.atomic():
+        alerts = list(
+            StockAlert.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(notified=False)
+            .select_related("raw", "product")
+        )
+        if not alerts:
+            return 0
+        mail_admins(
+            "Low stock: {} items".format(len(alerts)),
+            "\n".join(
+                "{}: {} available, reorder level {}".format(
+                    alert.raw or alert.product, alert.count, alert.reorder_level
+                )
+                for alert in alerts
+            ),
+            fail_silently=True,
+        )
+        StockAlert.objects.filter(id__in=[alert.id for alert in alerts]).update(
+            notified=True
+        )
+    return len(alerts)
@@ -13,3 +13,33 @@ RAW_ORDER_STATUS = (
     (FAIL, "FAIL"),
     (SUCCESS, "SUCCESS")
 )
+
+DAY = "day"
+WEEK = "week"
+MONTH = "month"
+
+PLANNING_GRANULARITY = (
+    (DAY, "day"),
+    (WEEK, "week")
+)
+
+ROLLUP_GRANULARITY = (
+    (DAY, "day"),
+    (MONTH, "month")
+)
+
+DELIVERY_DATE_FORMATS = ("%d.%m.%Y", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d")
+
+SNAPSHOT_CACHE_KEY = "planning:snapshot"
+PRODUCIBLE_CACHE_KEY = "planning:producible"
+ON_HAND_CACHE_KEY = "planning:on_hand:{}"
+
+SUGGESTED_RAW_ORDER_TITLE = "Purchase suggestion"
+
+AVERAGE = "average"
+FIFO = "fifo"
+
+VALUATION_METHODS = (
+    (AVERAGE, "average"),
+    (FIFO, "fifo")
+)
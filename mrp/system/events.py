@@ -0,0 +1,124 @@
+import json
+import queue
+import threading
+import time
+from django.conf import settings
+from rest_framework.utils.encoders import JSONEncoder
+
+EVENT_CHANNEL = "mrp:events"
+
+
+class Subscription(object):
+    """
+    Events queued for one stream. A subscriber too slow to keep up loses its
+    backlog and gets a single reset event telling it to reload its lists.
+    """
+
+    def __init__(self, types=None):
+        self.types = types
+        self.events = queue.Queue(maxsize=settings.EVENT_QUEUE_SIZE)
+
+    def put(self, event):
+        if self.types and event["type"] not in self.types:
+            return
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            with self.events.mutex:
+                self.events.queue.clear()
+            self.events.put_nowait({"type": "reset"})
+
+
+class EventHub(object):
+    """
+    In-process pub/sub between the signal handlers and the open streams. With
+    EVENT_BUS_URL set, events go through Redis so every worker sees them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = set()
+        self.listener = None
+
+    def subscribe(self, types=None):
+        subscription = Subscription(types)
+        with self.lock:
+            self.subscriptions.add(subscription)
+            if settings.EVENT_BUS_URL and self.listener is None:
+                self.listener = threading.Thread(target=self.listen, daemon=True)
+                self.listener.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def dispatch(self, event):
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def publish(self, event):
+        if not settings.EVENT_BUS_URL:
+            self.dispatch(event)
+            return
+        try:
+            bus().publish(EVENT_CHANNEL, json.dumps(event, cls=JSONEncoder))
+        except Exception as ex:
+            print(str(ex))
+
+    def listen(self):
+        while True:
+            try:
+                pubsub = bus().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(EVENT_CHANNEL)
+                for message in pubsub.listen():
+                    self.dispatch(json.loads(message["data"]))
+            except Exception as ex:
+                print(str(ex))
+                time.sleep(1)
+
+
+_bus = None
+
+
+def bus():
+    global _bus
+    if _bus is None:
+        import redis
+
+        _bus = redis.Redis.from_url(settings.EVENT_BUS_URL)
+    return _bus
+
+
+hub = EventHub()
+
+
+def publish(event):
+    hub.publish(event)
+
+
+def stream(types=None):
+    """
+    Yield stock and order events of the given types as server-sent events,
+    with a comment line every EVENT_STREAM_HEARTBEAT seconds to keep proxies
+    from closing the connection. The stream ends after EVENT_STREAM_MAX_AGE
+    seconds so worker processes are handed back; clients reconnect on their
+    own.
+    """
+    subscription = hub.subscribe(types)
+    deadline = time.monotonic() + settings.EVENT_STREAM_MAX_AGE
+    try:
+        yield "retry: 1000\n\n"
+        while time.monotonic() < deadline:
+            try:
+                event = subscription.events.get(timeout=settings.EVENT_STREAM_HEARTBEAT)
+            except queue.Empty:
+                yield ": ping\n\n"
+                continue
+            yield "event: {}\ndata: {}\n\n".format(
+                event["type"], json.dumps(event, cls=JSONEncoder)
+            )
+    finally:
+        hub.unsubscribe(subscription)
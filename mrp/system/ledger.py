@@ -0,0 +1,174 @@
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from system.constant import DAY, MONTH
+from system.models import Budget, BudgetAccount, BudgetRollup
+from system.versions import bump_versions
+
+ACCOUNT_ID = 1
+
+
+def post_budget(total_income=Decimal(0), total_outcome=Decimal(0), salaries=Decimal(0), **links):
+    """
+    Add an income/expense row to the budget ledger and return it.
+
+    The balance lives in one BudgetAccount row that is incremented in place,
+    so concurrent postings serialize on its row lock instead of reading the
+    latest Budget row and overwriting each other. Each Budget row records the
+    balance right after its own posting. `links` are the product_order or
+    raw_order the posting belongs to.
+    """
+    total_income = total_income or Decimal(0)
+    total_outcome = total_outcome or Decimal(0)
+    salaries = salaries or Decimal(0)
+    delta = total_income - total_outcome - salaries
+    account = BudgetAccount.objects.filter(id=ACCOUNT_ID)
+    with transaction.atomic():
+        if not account.update(total=F("total") + delta):
+            open_account()
+            account.update(total=F("total") + delta)
+        add_rollups(timezone.localdate(), total_income, total_outcome, salaries)
+        return Budget.objects.create(
+            total_income=total_income,
+            total_outcome=total_outcome,
+            salaries=salaries,
+            total=account.values_list("total", flat=True).get(),
+            **links
+        )
+
+
+def rollup_periods(day):
+    return ((DAY, day), (MONTH, day.replace(day=1)))
+
+
+def add_rollups(day, income, expense, salaries):
+    """
+    Add one posting to the daily and monthly rollup rows of `day`, creating
+    them on first use. Increments go through F() so concurrent postings on
+    the same period add up instead of overwriting each other.
+    """
+    changes = {
+        "income": F("income") + income,
+        "expense": F("expense") + expense,
+        "salaries": F("salaries") + salaries,
+        "net": F("net") + (income - expense - salaries),
+    }
+    for granularity, period in rollup_periods(day):
+        rollup = BudgetRollup.objects.filter(granularity=granularity, period=period)
+        if not rollup.update(**changes):
+            BudgetRollup.objects.get_or_create(granularity=granularity, period=period)
+            rollup.update(**changes)
+
+
+def rebuild_rollups():
+    """
+    Recompute every rollup row from the Budget ledger, for rows posted before
+    the rollups existed or after a manual correction of the ledger.
+    """
+    totals = {}
+    rows = Budget.objects.order_by().values_list(
+        "created_at", "total_income", "total_outcome", "salaries"
+    )
+    for created_at, income, expense, salaries in rows.iterator():
+        day = timezone.localdate(created_at)
+        for key in rollup_periods(day):
+            row = totals.setdefault(key, [Decimal(0)] * 3)
+            row[0] += income or Decimal(0)
+            row[1] += expense or Decimal(0)
+            row[2] += salaries or Decimal(0)
+    with transaction.atomic():
+        BudgetRollup.objects.all().delete()
+        BudgetRollup.objects.bulk_create(
+            [
+                BudgetRollup(
+                    granularity=granularity,
+                    period=period,
+                    income=income,
+                    expense=expense,
+                    salaries=salaries,
+                    net=income - expense - salaries,
+                )
+                for (granularity, period), (income, expense, salaries) in totals.items()
+            ],
+            batch_size=1000,
+        )
+    return len(totals)
+
+
+def rebuild_totals(opening=Decimal(0), fix=False, chunk_size=None, samples=20):
+    """
+    Recompute the running balance of every Budget row in posting order,
+    starting from `opening`, and report the rows whose stored total differs.
+
+    Rows are streamed through a server-side cursor and only the pending
+    corrections of the current chunk are held in memory, so the ledger can
+    be any size. With `fix`, wrong totals are rewritten with one bulk update
+    per chunk and the account is moved by the drift of the last row, which
+    is also the drift of the balance it holds.
+    """
+    chunk_size = chunk_size or settings.BUDGET_REBUILD_CHUNK_SIZE
+    rows = Budget.objects.order_by("created_at", "id").values_list(
+        "id", "total_income", "total_outcome", "salaries", "total"
+    )
+    report = {"rows": 0, "divergent": 0, "divergences": [], "balance": opening, "drift": Decimal(0)}
+    balance = opening
+    pending = []
+    for budget_id, income, expense, salaries, total in rows.iterator(chunk_size=chunk_size):
+        balance += (income or 0) - (expense or 0) - (salaries or 0)
+        report["rows"] += 1
+        report["drift"] = balance - (total or 0)
+        if report["drift"]:
+            report["divergent"] += 1
+            if len(report["divergences"]) < samples:
+                report["divergences"].append(
+                    {"id": budget_id, "total": total, "expected": balance}
+                )
+            if fix:
+                pending.append(Budget(id=budget_id, total=balance))
+                if len(pending) >= chunk_size:
+                    Budget.objects.bulk_update(pending, ["total"])
+                    pending = []
+    report["balance"] = balance
+    if fix:
+        if pending:
+            Budget.objects.bulk_update(pending, ["total"])
+        if report["divergent"]:
+            bump_versions(Budget)
+        if report["drift"]:
+            BudgetAccount.objects.filter(id=ACCOUNT_ID).update(
+                total=F("total") + report["drift"]
+            )
+    return report
+
+
+def open_account():
+    """
+    Create the account row, carrying over the balance of the latest Budget
+    row written before the account existed.
+    """
+    BudgetAccount.objects.get_or_create(
+        id=ACCOUNT_ID,
+        defaults={"total": Budget.objects.values_list("total", flat=True).first() or Decimal(0)},
+    )
+
+
+def load_account():
+    """
+    Return the account row, or None when nothing was ever posted. Before the
+    first posting opens it, an unsaved account holding the balance of the
+    latest Budget row is returned, so reading the balance writes nothing.
+    """
+    account = BudgetAccount.objects.filter(id=ACCOUNT_ID).first()
+    if account is None:
+        latest = Budget.objects.values_list("total", "created_at", "updated_at").first()
+        if latest is not None:
+            total, created_at, updated_at = latest
+            account = BudgetAccount(
+                id=ACCOUNT_ID,
+                total=total or Decimal(0),
+                created_at=created_at,
+                updated_at=updated_at,
+            )
+    return account
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from system.ledger import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily and monthly budget rollups from the budget ledger."
+
+    def handle(self, *args, **options):
+        self.stdout.write("{} rollup rows written.".format(rebuild_rollups()))
@@ -0,0 +1,20 @@
+import json
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from rest_framework.utils.encoders import JSONEncoder
+from system.ledger import rebuild_totals
+
+
+class Command(BaseCommand):
+    help = "Recompute the running budget totals from the postings and report or fix divergent rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--fix", action="store_true", help="rewrite divergent totals")
+        parser.add_argument("--opening", type=Decimal, default=Decimal(0), help="balance before the first row")
+        parser.add_argument("--chunk-size", type=int, default=None)
+
+    def handle(self, *args, **options):
+        report = rebuild_totals(
+            opening=options["opening"], fix=options["fix"], chunk_size=options["chunk_size"]
+        )
+        self.stdout.write(json.dumps(report, indent=2, cls=JSONEncoder))
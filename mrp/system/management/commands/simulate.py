@@ -0,0 +1,24 @@
+import json
+import sys
+from django.core.management.base import BaseCommand
+from rest_framework.utils.encoders import JSONEncoder
+from system.simulation import simulate_many
+
+
+class Command(BaseCommand):
+    help = "Run what-if scenarios from a JSON file against current stock and budget."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", help="JSON scenario or list of scenarios, stdin if omitted")
+        parser.add_argument("--workers", type=int, default=None)
+
+    def handle(self, *args, **options):
+        if options["path"]:
+            with open(options["path"]) as scenario_file:
+                scenarios = json.load(scenario_file)
+        else:
+            scenarios = json.load(sys.stdin)
+        if isinstance(scenarios, dict):
+            scenarios = [scenarios]
+        results = simulate_many(scenarios, options["workers"])
+        self.stdout.write(json.dumps(results, cls=JSONEncoder, indent=2))
@@ -1,9 +1,15 @@
 from django.utils.translation import ugettext_lazy as _
-from django.db import models
+from django.db import models, transaction
 from django.dispatch import receiver
-from django.db.models.signals import pre_save, post_save
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+from django.core.cache import cache
 from system.constant import *
-from product.models import Product, Raw, RawForProduction
+from django.utils import timezone
+from product.models import Product, Raw, RawForProduction, ProductForProduction, ProductAttr
+from stock.models import ProductStock, RawStock
+from stock.constant import PRODUCTION, RECEIPT
+from stock.signals import stock_changed, stock_reserved
+from stock.tools import move_stock
 from profile.models import UserProfile
 from decimal import Decimal
 from django.contrib.postgres.fields import JSONField
@@ -25,6 +31,7 @@ class Client(models.Model):
         verbose_name = _("Customer")
         verbose_name_plural = _("Customers")
         ordering = ("-created_at",)
+        indexes = [models.Index(fields=["created_at", "id"])]
 
     def __str__(self):
         return "{}".format(self.name)
@@ -46,6 +53,7 @@ class Supplier(models.Model):
         verbose_name = _("Supplier")
         verbose_name_plural = _("Suppliers")
         ordering = ("-created_at",)
+        indexes = [models.Index(fields=["created_at", "id"])]
 
     def __str__(self):
         return "{}".format(self.name)
@@ -118,6 +126,7 @@ class ProductOrder(models.Model):
         verbose_name = _("Product Order")
         verbose_name_plural = _("Product Orders")
         ordering = ("-created_at",)
+        indexes = [models.Index(fields=["created_at", "id"])]
 
     def __str__(self):
         return "{}".format(self.product.name)
@@ -190,6 +199,7 @@ class RawOrder(models.Model):
         verbose_name = _("Raw Material Order")
         verbose_name_plural = _("Raw Material Orders")
         ordering = ("-created_at",)
+        indexes = [models.Index(fields=["created_at", "id"])]
 
     def __str__(self):
         return "{}".format(self.raw.name)
@@ -251,11 +261,121 @@ class Budget(models.Model):
         verbose_name = _("Income/Expense")
         verbose_name_plural = _("Income/Expense")
         ordering = ("-created_at",)
+        indexes = [models.Index(fields=["created_at", "id"])]
 
     def __str__(self):
         return "{}".format(self.total)
 
 
+class BudgetAccount(models.Model):
+    total = models.DecimalField(
+        _("Overall Total"), decimal_places=2, max_digits=14, default=Decimal(0)
+    )
+    created_at = models.DateTimeField(
+        _("Created Data"), auto_now_add=True, editable=False
+    )
+    updated_at = models.DateTimeField(_("Updated Data"), auto_now=True, editable=False)
+
+    class Meta:
+        verbose_name = _("Budget Account")
+        verbose_name_plural = _("Budget Accounts")
+
+    def __str__(self):
+        return "{}".format(self.total)
+
+
+class BudgetRollup(models.Model):
+    granularity = models.CharField(
+        _("Granularity"), choices=ROLLUP_GRANULARITY, max_length=150
+    )
+    period = models.DateField(_("Period Start"))
+    income = models.DecimalField(
+        _("Total Revenue"), decimal_places=2, max_digits=14, default=Decimal(0)
+    )
+    expense = models.DecimalField(
+        _("Total Expense"), decimal_places=2, max_digits=14, default=Decimal(0)
+    )
+    salaries = models.DecimalField(
+        _("Salaries"), decimal_places=2, max_digits=14, default=Decimal(0)
+    )
+    net = models.DecimalField(
+        _("Net"), decimal_places=2, max_digits=14, default=Decimal(0)
+    )
+    updated_at = models.DateTimeField(_("Updated Data"), auto_now=True, editable=False)
+
+    class Meta:
+        verbose_name = _("Budget Rollup")
+        verbose_name_plural = _("Budget Rollups")
+        ordering = ("granularity", "period")
+        unique_together = ("granularity", "period")
+
+    def __str__(self):
+        return "{} {}".format(self.granularity, self.period)
+
+
+class PayrollRun(models.Model):
+    period = models.DateField(_("Pay Period"), unique=True)
+    budget = models.OneToOneField(
+        Budget,
+        verbose_name=_("Income/Expense"),
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+    )
+    employees = models.PositiveIntegerField(_("Employees"), default=0)
+    total = models.DecimalField(
+        _("Total Salaries"), decimal_places=2, max_digits=14, default=Decimal(0)
+    )
+    created_at = models.DateTimeField(
+        _("Created Data"), auto_now_add=True, editable=False
+    )
+
+    class Meta:
+        verbose_name = _("Payroll Run")
+        verbose_name_plural = _("Payroll Runs")
+        ordering = ("-period",)
+
+    def __str__(self):
+        return "{}".format(self.period)
+
+
+class Payslip(models.Model):
+    payroll_run = models.ForeignKey(
+        PayrollRun,
+        verbose_name=_("Payroll Run"),
+        related_name="payslips",
+        on_delete=models.CASCADE,
+    )
+    user = models.ForeignKey(
+        UserProfile,
+        verbose_name=_("Staff"),
+        related_name="payslips",
+        on_delete=models.PROTECT,
+    )
+    salary = models.DecimalField(_("Staff Salary"), decimal_places=2, max_digits=10)
+
+    class Meta:
+        verbose_name = _("Payslip")
+        verbose_name_plural = _("Payslips")
+        unique_together = ("payroll_run", "user")
+
+    def __str__(self):
+        return "{} {}".format(self.payroll_run, self.user)
+
+
+class TableVersion(models.Model):
+    name = models.CharField(_("Table"), unique=True, max_length=150)
+    version = models.BigIntegerField(_("Version"), default=0)
+    updated_at = models.DateTimeField(_("Updated Data"), default=timezone.now)
+
+    class Meta:
+        verbose_name = _("Table Version")
+        verbose_name_plural = _("Table Versions")
+
+    def __str__(self):
+        return "{} {}".format(self.name, self.version)
+
+
 class DamagedRaw(models.Model):
     raw_order = models.ForeignKey(
         RawOrder, on_delete=models.CASCADE, verbose_name=_("Raw Material Order")
@@ -298,6 +418,123 @@ class DamagedProduct(models.Model):
         return "{}".format(self.product.name)
 
 
+class MaterialRequirement(models.Model):
+    raw = models.OneToOneField(
+        Raw,
+        on_delete=models.CASCADE,
+        verbose_name=_("Raw Material"),
+        related_name="requirement",
+    )
+    gross_requirement = models.DecimalField(
+        _("Gross Requirement"), decimal_places=2, max_digits=12, default=Decimal(0)
+    )
+    on_hand = models.DecimalField(
+        _("On Hand"), decimal_places=2, max_digits=12, default=Decimal(0)
+    )
+    net_requirement = models.DecimalField(
+        _("Net Requirement"), decimal_places=2, max_digits=12, default=Decimal(0)
+    )
+    created_at = models.DateTimeField(
+        _("Created Data"), auto_now_add=True, editable=False
+    )
+    updated_at = models.DateTimeField(_("Updated Data"), auto_now=True, editable=False)
+
+    class Meta:
+        verbose_name = _("Material Requirement")
+        verbose_name_plural = _("Material Requirements")
+        ordering = ("-net_requirement",)
+
+    def __str__(self):
+        return "{}".format(self.raw.name)
+
+
+class OrderPlan(models.Model):
+    product_order = models.OneToOneField(
+        ProductOrder,
+        on_delete=models.CASCADE,
+        verbose_name=_("Product Order"),
+        related_name="plan",
+    )
+    feasible = models.BooleanField(_("Feasible"), default=True)
+    shortage = models.DecimalField(
+        _("Shortage"), decimal_places=2, max_digits=12, default=Decimal(0)
+    )
+    created_at = models.DateTimeField(
+        _("Created Data"), auto_now_add=True, editable=False
+    )
+    updated_at = models.DateTimeField(_("Updated Data"), auto_now=True, editable=False)
+
+    class Meta:
+        verbose_name = _("Order Plan")
+        verbose_name_plural = _("Order Plans")
+        ordering = ("-created_at",)
+
+    def __str__(self):
+        return "{}".format(self.product_order_id)
+
+
+class StockReservation(models.Model):
+    product_order = models.ForeignKey(
+        ProductOrder,
+        on_delete=models.CASCADE,
+        verbose_name=_("Product Order"),
+        related_name="reservations",
+    )
+    raw_stock = models.ForeignKey(
+        RawStock,
+        on_delete=models.CASCADE,
+        verbose_name=_("Raw Material Stock"),
+        related_name="reservations",
+    )
+    quantity = models.PositiveIntegerField(_("Reserved Quantity"))
+    expires_at = models.DateTimeField(_("Expiry Date"), db_index=True)
+    created_at = models.DateTimeField(
+        _("Created Data"), auto_now_add=True, editable=False
+    )
+
+    class Meta:
+        verbose_name = _("Stock Reservation")
+        verbose_name_plural = _("Stock Reservations")
+        ordering = ("expires_at",)
+        unique_together = ("product_order", "raw_stock")
+
+    def __str__(self):
+        return "{} {}".format(self.raw_stock, self.quantity)
+
+
+class StockAlert(models.Model):
+    raw = models.OneToOneField(
+        Raw,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        verbose_name=_("Raw Material"),
+        related_name="stock_alert",
+    )
+    product = models.OneToOneField(
+        Product,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        verbose_name=_("Product"),
+        related_name="stock_alert",
+    )
+    count = models.IntegerField(_("Available"))
+    reorder_level = models.PositiveIntegerField(_("Reorder Level"))
+    notified = models.BooleanField(_("Notified"), default=False)
+    created_at = models.DateTimeField(
+        _("Created Data"), auto_now_add=True, editable=False
+    )
+    updated_at = models.DateTimeField(_("Updated Data"), auto_now=True, editable=False)
+
+    class Meta:
+        verbose_name = _("Stock Alert")
+        verbose_name_plural = _("Stock Alerts")
+        ordering = ("-created_at",)
+
+    def __str__(self):
+        return "{}".format(self.raw or self.product)
+
 """
 
 @receiver(post_save, sender=ProductOrder)
@@ -363,61 +600,268 @@ def set_raw_order_total(sender, instance, **kwargs):
     instance.total = instance.raw.unit_price * instance.quantity
 
 
+@receiver(pre_save, sender=ProductOrder)
+@receiver(pre_save, sender=RawOrder)
+def remember_order_status(sender, instance, **kwargs):
+    # inside a transaction the row stays locked until commit, so concurrent
+    # updates of the same order cannot both see it leave the old status
+    previous = sender.objects.filter(pk=instance.pk)
+    if not transaction.get_autocommit():
+        previous = previous.select_for_update()
+    instance._old_status = (
+        previous.values_list("status", flat=True).first() if instance.pk else None
+    )
+
+
+def became_successful(instance):
+    return instance.status == SUCCESS and getattr(instance, "_old_status", None) != SUCCESS
+
+
 @receiver(post_save, sender=RawOrder)
 def set_budget_raw(sender, instance, **kwargs):
-    if instance.status == SUCCESS:
-        budget = Budget.objects.filter()
-        if budget.exists():
-            total = budget.first().total
-        else:
-            total = 0
-        Budget.objects.create(
-            raw_order=instance,
-            total_outcome=instance.total,
-            total=total - instance.total,
-        )
+    from system.ledger import post_budget
+
+    if became_successful(instance):
+        post_budget(raw_order=instance, total_outcome=instance.total)
 
 
 @receiver(post_save, sender=ProductOrder)
 def set_budget(sender, instance, **kwargs):
-    if instance.status == SUCCESS:
-        budget = Budget.objects.filter()
-        if budget.exists():
-            total = budget.first().total
-        else:
-            total = 0
-        Budget.objects.create(
-            product_order=instance,
-            total_income=instance.total,
-            total=total + instance.total,
-        )
+    from system.ledger import post_budget
+
+    if became_successful(instance):
+        post_budget(product_order=instance, total_income=instance.total)
 
 
 @receiver(post_save, sender=ProductOrder)
 def add_product_stock(sender, instance, **kwargs):
-    if instance.status == SUCCESS:
-        instance.product.stock.count += instance.quantity
-        instance.product.stock.save()
+    from system.reservations import consume_reservations
+
+    if became_successful(instance):
+        # the product is valued at what its raw materials cost under each method
+        consumed = consume_reservations(instance).values()
+        cost = (
+            -sum((average for average, fifo in consumed), Decimal(0)),
+            -sum((fifo for average, fifo in consumed), Decimal(0)),
+        )
+        move_stock(
+            ProductStock,
+            {instance.product.stock_id: instance.quantity},
+            PRODUCTION,
+            {instance.product.stock_id: cost},
+        )
+
+
+@receiver(post_save, sender=ProductOrder)
+def reserve_raw_stock(sender, instance, created, **kwargs):
+    from system.reservations import reserve_order
+
+    if instance.status == WAITING and created:
+        reserve_order(instance)
 
 
 @receiver(post_save, sender=ProductOrder)
-def remove_raw_stock(sender, instance, **kwargs):
-    if instance.status == WAITING and kwargs["created"]:
-        raws = instance.product.raws.all()
-        for raw in raws:
-            total = instance.quantity * Decimal(raw.quantity_for_prod)
-            raw.raw.stock.count -= total
-            raw.raw.stock.save()
+def release_failed_order_reservations(sender, instance, **kwargs):
+    from system.tasks import task_release_reservations
+
+    if instance.status == FAIL:
+        transaction.on_commit(lambda: task_release_reservations.delay())
+
+
+@receiver(pre_delete, sender=ProductOrder)
+def release_deleted_order_reservations(sender, instance, **kwargs):
+    from system.reservations import release_order
+
+    release_order(instance.id)
 
 
 @receiver(post_save, sender=RawOrder)
 def add_raw_stock(sender, instance, **kwargs):
-    if instance.status == SUCCESS:
-        instance.raw.stock.count += instance.quantity
-        instance.raw.stock.save()
+    if became_successful(instance):
+        move_stock(
+            RawStock,
+            {instance.raw.stock_id: instance.quantity},
+            RECEIPT,
+            {instance.raw.stock_id: (instance.total, instance.total)},
+        )
 
 
-@receiver(pre_save, sender=Budget)
-def set_budget_for_salaries(sender, instance, **kwargs):
-    if instance.salaries:
-        instance.total -= instance.salaries
+def refresh_stock_alerts(model, stock_ids):
+    from system.alerts import check_stock_alerts
+    from system.tasks import task_deliver_stock_alerts
+
+    if check_stock_alerts(model, stock_ids):
+        transaction.on_commit(lambda: task_deliver_stock_alerts.delay())
+
+
+def refresh_raw_stock_reports(stock_ids):
+    from system.planning import refresh_producible, refresh_snapshot
+    from system.tasks import task_replan_raws
+
+    def refresh_reports():
+        refresh_snapshot(stock_ids)
+        refresh_producible(stock_ids)
+
+    transaction.on_commit(refresh_reports)
+    refresh_stock_alerts(RawStock, stock_ids)
+    transaction.on_commit(lambda: task_replan_raws.delay(stock_ids))
+
+
+@receiver(post_save, sender=RawStock)
+def raw_stock_saved(sender, instance, created, **kwargs):
+    if not created:
+        refresh_raw_stock_reports([instance.id])
+
+
+@receiver(stock_changed, sender=RawStock)
+@receiver(stock_reserved, sender=RawStock)
+def raw_stock_moved(sender, deltas, **kwargs):
+    refresh_raw_stock_reports(list(deltas))
+
+
+@receiver(post_save, sender=ProductStock)
+def product_stock_saved(sender, instance, created, **kwargs):
+    if not created:
+        refresh_stock_alerts(ProductStock, [instance.id])
+
+
+@receiver(stock_changed, sender=ProductStock)
+def product_stock_moved(sender, deltas, **kwargs):
+    refresh_stock_alerts(ProductStock, list(deltas))
+
+
+@receiver(post_save, sender=Raw)
+def raw_reorder_level_saved(sender, instance, **kwargs):
+    refresh_stock_alerts(RawStock, [instance.stock_id])
+
+
+@receiver(post_save, sender=Product)
+def product_reorder_level_saved(sender, instance, **kwargs):
+    refresh_stock_alerts(ProductStock, [instance.stock_id])
+
+
+@receiver(post_delete, sender=RawStock)
+@receiver(post_save, sender=Raw)
+@receiver(post_delete, sender=Raw)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=RawForProduction)
+@receiver(post_delete, sender=RawForProduction)
+@receiver(post_save, sender=ProductForProduction)
+@receiver(post_delete, sender=ProductForProduction)
+def invalidate_planning_snapshot(sender, instance, **kwargs):
+    keys = [SNAPSHOT_CACHE_KEY, PRODUCIBLE_CACHE_KEY]
+    if sender is Raw:
+        # a raw may have been moved to another stock
+        keys.append(ON_HAND_CACHE_KEY.format(instance.id))
+    cache.delete_many(keys)
+
+
+def publish_on_commit(event):
+    from system.events import publish
+
+    transaction.on_commit(lambda: publish(event))
+
+
+@receiver(post_save, sender=ProductStock)
+def publish_product_stock(sender, instance, **kwargs):
+    publish_on_commit(
+        {
+            "type": "product_stock",
+            "id": instance.id,
+            "name": instance.name,
+            "count": instance.count,
+        }
+    )
+
+
+@receiver(post_save, sender=RawStock)
+def publish_raw_stock(sender, instance, **kwargs):
+    publish_on_commit(
+        {
+            "type": "raw_stock",
+            "id": instance.id,
+            "name": instance.name,
+            "count": instance.count,
+            "reserved": instance.reserved,
+        }
+    )
+
+
+@receiver(stock_changed, sender=ProductStock)
+@receiver(stock_changed, sender=RawStock)
+def publish_stock_moved(sender, deltas, **kwargs):
+    publish_on_commit(
+        {
+            "type": "product_stock" if sender is ProductStock else "raw_stock",
+            "deltas": deltas,
+        }
+    )
+
+
+@receiver(stock_reserved, sender=RawStock)
+def publish_stock_reserved(sender, deltas, **kwargs):
+    publish_on_commit({"type": "raw_stock", "reserved_deltas": deltas})
+
+
+@receiver(post_save, sender=ProductOrder)
+def publish_product_order(sender, instance, created, **kwargs):
+    publish_on_commit(
+        {
+            "type": "product_order",
+            "id": instance.id,
+            "product": instance.product_id,
+            "quantity": instance.quantity,
+            "status": instance.status,
+            "created": created,
+        }
+    )
+
+
+@receiver(post_save, sender=RawOrder)
+def publish_raw_order(sender, instance, created, **kwargs):
+    publish_on_commit(
+        {
+            "type": "raw_order",
+            "id": instance.id,
+            "raw": instance.raw_id,
+            "quantity": instance.quantity,
+            "status": instance.status,
+            "created": created,
+        }
+    )
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+@receiver(post_save, sender=Supplier)
+@receiver(post_delete, sender=Supplier)
+@receiver(post_save, sender=ProductOrder)
+@receiver(post_delete, sender=ProductOrder)
+@receiver(post_save, sender=RawOrder)
+@receiver(post_delete, sender=RawOrder)
+@receiver(post_save, sender=Budget)
+@receiver(post_delete, sender=Budget)
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Raw)
+@receiver(post_delete, sender=Raw)
+@receiver(post_save, sender=RawForProduction)
+@receiver(post_delete, sender=RawForProduction)
+@receiver(post_save, sender=ProductForProduction)
+@receiver(post_delete, sender=ProductForProduction)
+@receiver(post_save, sender=ProductAttr)
+@receiver(post_delete, sender=ProductAttr)
+@receiver(post_save, sender=ProductStock)
+@receiver(post_delete, sender=ProductStock)
+@receiver(post_save, sender=RawStock)
+@receiver(post_delete, sender=RawStock)
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+@receiver(stock_changed, sender=ProductStock)
+@receiver(stock_changed, sender=RawStock)
+@receiver(stock_reserved, sender=RawStock)
+def bump_table_version(sender, **kwargs):
+    from system.versions import bump_versions
+
+    bump_versions(sender)
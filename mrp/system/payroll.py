@@ -0,0 +1,46 @@
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from profile.models import UserProfile
+from system.ledger import post_budget
+from system.models import PayrollRun, Payslip
+
+PAYSLIP_BATCH = 1000
+
+
+def pay_period(day=None):
+    """
+    Return the first day of the month `day` falls in, today by default.
+    """
+    return (day or timezone.localdate()).replace(day=1)
+
+
+def run_payroll(period=None):
+    """
+    Pay every active staff member with a salary for `period` and return the
+    PayrollRun, or None when the period was already paid.
+
+    The run, its payslips and the single salaries posting to the budget are
+    written in one transaction, and the unique period makes a retried or
+    concurrent run for the same month a no-op instead of a second payment.
+    """
+    period = pay_period(period)
+    with transaction.atomic():
+        payroll_run, created = PayrollRun.objects.get_or_create(period=period)
+        if not created:
+            return None
+        staff = UserProfile.objects.filter(is_active=True, salary__gt=0).order_by()
+        Payslip.objects.bulk_create(
+            (
+                Payslip(payroll_run=payroll_run, user_id=user_id, salary=salary)
+                for user_id, salary in staff.values_list("id", "salary").iterator()
+            ),
+            batch_size=PAYSLIP_BATCH,
+        )
+        paid = payroll_run.payslips.aggregate(employees=Count("id"), total=Sum("salary"))
+        payroll_run.employees = paid["employees"]
+        payroll_run.total = paid["total"] or 0
+        if payroll_run.total:
+            payroll_run.budget = post_budget(salaries=payroll_run.total)
+        payroll_run.save(update_fields=["employees", "total", "budget"])
+    return payroll_run
@@ -0,0 +1,479 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal, ROUND_CEILING
+from itertools import accumulate
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import OuterRef, Subquery, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from product.bom import load_flat_recipes
+from product.models import Product, Raw, FlatRecipe
+from system.constant import SUGGESTED_RAW_ORDER_TITLE, WAITING, DAY, WEEK, DELIVERY_DATE_FORMATS, SNAPSHOT_CACHE_KEY
+from system.constant import PRODUCIBLE_CACHE_KEY, ON_HAND_CACHE_KEY
+from system.models import ProductOrder, RawOrder, MaterialRequirement, OrderPlan
+from system.versions import bump_versions
+
+
+def plan_orders(orders, recipes, on_hand):
+    """
+    Allocate raw stock to orders in the given priority order.
+
+    `orders` is an iterable of (order_id, product_id, quantity), `recipes`
+    maps a product id to its flattened {raw_id: quantity} and `on_hand` maps a
+    raw id to its stock count. Returns the gross requirement per raw and the
+    raw shortage per order, computed with running totals in a single pass.
+    """
+    gross = defaultdict(Decimal)
+    shortages = {}
+    for order_id, product_id, quantity in orders:
+        shortage = Decimal(0)
+        for raw_id, per_unit in recipes.get(product_id, {}).items():
+            needed = quantity * per_unit
+            available = max(on_hand.get(raw_id, 0) - gross[raw_id], 0)
+            gross[raw_id] += needed
+            shortage += max(needed - available, 0)
+        shortages[order_id] = shortage
+    return dict(gross), shortages
+
+
+def load_on_hand(raw_ids=None, available=False):
+    """
+    Return {raw_id: stock count}, less what WAITING orders reserved if
+    `available` is set.
+    """
+    raws = Raw.objects.order_by()
+    if raw_ids is not None:
+        raws = raws.filter(id__in=raw_ids)
+    return {
+        raw_id: Decimal(count - reserved if available else count)
+        for raw_id, count, reserved in raws.values_list(
+            "id", "stock__count", "stock__reserved"
+        )
+    }
+
+
+def run_mrp():
+    """
+    Plan every WAITING product order against the current raw stock and
+    replace the MaterialRequirement and OrderPlan tables with the result.
+    """
+    orders = list(
+        ProductOrder.objects.filter(status=WAITING, quantity__isnull=False)
+        .order_by("created_at", "id")
+        .values_list("id", "product_id", "quantity")
+    )
+    recipes = load_flat_recipes({product_id for order_id, product_id, quantity in orders})
+    on_hand = load_on_hand()
+    gross, shortages = plan_orders(orders, recipes, on_hand)
+
+    requirements = [
+        MaterialRequirement(
+            raw_id=raw_id,
+            gross_requirement=quantity,
+            on_hand=on_hand.get(raw_id, 0),
+            net_requirement=max(quantity - on_hand.get(raw_id, 0), 0),
+        )
+        for raw_id, quantity in gross.items()
+    ]
+    plans = [
+        OrderPlan(product_order_id=order_id, feasible=not shortage, shortage=shortage)
+        for order_id, shortage in shortages.items()
+    ]
+    with transaction.atomic():
+        MaterialRequirement.objects.all().delete()
+        OrderPlan.objects.all().delete()
+        MaterialRequirement.objects.bulk_create(requirements, batch_size=1000)
+        OrderPlan.objects.bulk_create(plans, batch_size=1000)
+    return {
+        "orders": len(plans),
+        "infeasible_orders": sum(1 for plan in plans if not plan.feasible),
+        "short_raws": sum(1 for item in requirements if item.net_requirement),
+    }
+
+
+def replan_raws(stock_ids):
+    """
+    Refresh the MRP tables after the given raw stocks changed, touching only
+    the requirements of their raws and the plans of orders that use them.
+
+    An order's flag depends on every raw in its recipe, and the allocation of
+    those raws on every other order that uses them, so the orders sharing a
+    raw with an affected order are replayed too, restricted to those raws.
+    """
+    changed = set(
+        Raw.objects.filter(stock_id__in=stock_ids).values_list("id", flat=True)
+    )
+    affected = set(
+        FlatRecipe.objects.filter(raw_id__in=changed)
+        .order_by()
+        .values_list("product_id", flat=True)
+    )
+    raw_ids = changed | set(
+        FlatRecipe.objects.filter(product_id__in=affected)
+        .order_by()
+        .values_list("raw_id", flat=True)
+    )
+    sharing = set(
+        FlatRecipe.objects.filter(raw_id__in=raw_ids)
+        .order_by()
+        .values_list("product_id", flat=True)
+    )
+    orders = list(
+        ProductOrder.objects.filter(
+            status=WAITING, quantity__isnull=False, product_id__in=sharing
+        )
+        .order_by("created_at", "id")
+        .values_list("id", "product_id", "quantity")
+    )
+    recipes = {
+        product_id: {
+            raw_id: quantity for raw_id, quantity in raws.items() if raw_id in raw_ids
+        }
+        for product_id, raws in load_flat_recipes(sharing).items()
+    }
+    on_hand = load_on_hand(raw_ids)
+    gross, shortages = plan_orders(orders, recipes, on_hand)
+
+    requirements = [
+        MaterialRequirement(
+            raw_id=raw_id,
+            gross_requirement=gross[raw_id],
+            on_hand=on_hand.get(raw_id, 0),
+            net_requirement=max(gross[raw_id] - on_hand.get(raw_id, 0), 0),
+        )
+        for raw_id in changed
+        if raw_id in gross
+    ]
+    plans = [
+        OrderPlan(
+            product_order_id=order_id,
+            feasible=not shortages[order_id],
+            shortage=shortages[order_id],
+        )
+        for order_id, product_id, quantity in orders
+        if product_id in affected
+    ]
+    with transaction.atomic():
+        MaterialRequirement.objects.filter(raw_id__in=changed).delete()
+        OrderPlan.objects.filter(
+            product_order_id__in=[plan.product_order_id for plan in plans]
+        ).delete()
+        MaterialRequirement.objects.bulk_create(requirements, batch_size=1000)
+        OrderPlan.objects.bulk_create(plans, batch_size=1000)
+
+
+def parse_delivery_date(value):
+    """
+    Turn a free-text delivery date into a date, or None if it can't be read.
+    """
+    value = (value or "").strip()
+    if not value:
+        return None
+    try:
+        parsed = parse_date(value) or parse_datetime(value)
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        for date_format in DELIVERY_DATE_FORMATS:
+            try:
+                parsed = datetime.strptime(value, date_format)
+                break
+            except ValueError:
+                continue
+    if isinstance(parsed, datetime):
+        return parsed.date()
+    return parsed
+
+
+def time_phased_plan(start=None, buckets=12, granularity=DAY):
+    """
+    Bucket WAITING product order demand and WAITING raw order supply per day
+    or week and project the on-hand quantity of every affected raw material.
+
+    Orders due before `start` or without a readable delivery date land in the
+    first bucket, orders due after the horizon are left out. For each raw the
+    result holds per-bucket gross requirement, scheduled receipts, projected
+    on hand and the new net requirement first uncovered in that bucket.
+    """
+    start = start or timezone.localdate()
+    step = 7 if granularity == WEEK else 1
+
+    def bucket_of(value):
+        delivery_date = parse_delivery_date(value)
+        if delivery_date is None:
+            return 0
+        index = max((delivery_date - start).days // step, 0)
+        return index if index < buckets else None
+
+    demand = defaultdict(lambda: [Decimal(0)] * buckets)
+    supply = defaultdict(lambda: [Decimal(0)] * buckets)
+    orders = list(
+        ProductOrder.objects.filter(status=WAITING, quantity__isnull=False)
+        .order_by()
+        .values_list("product_id", "quantity", "delivery_date")
+    )
+    recipes = load_flat_recipes({product_id for product_id, quantity, date in orders})
+    for product_id, quantity, delivery_date in orders:
+        index = bucket_of(delivery_date)
+        if index is None:
+            continue
+        for raw_id, per_unit in recipes.get(product_id, {}).items():
+            demand[raw_id][index] += quantity * per_unit
+    receipts = (
+        RawOrder.objects.filter(status=WAITING, quantity__isnull=False)
+        .order_by()
+        .values_list("raw_id", "quantity", "delivery_date")
+    )
+    for raw_id, quantity, delivery_date in receipts:
+        index = bucket_of(delivery_date)
+        if index is not None:
+            supply[raw_id][index] += quantity
+
+    on_hand = load_on_hand()
+    raws = {}
+    for raw_id in set(demand) | set(supply):
+        gross = demand[raw_id]
+        scheduled = supply[raw_id]
+        projected = [
+            on_hand.get(raw_id, 0) + balance
+            for balance in accumulate(r - g for r, g in zip(scheduled, gross))
+        ]
+        shortfall = list(accumulate((max(-p, 0) for p in projected), max))
+        net = [b - a for a, b in zip([Decimal(0)] + shortfall, shortfall)]
+        raws[raw_id] = {
+            "gross_requirement": gross,
+            "scheduled_receipts": scheduled,
+            "projected_on_hand": projected,
+            "net_requirement": net,
+        }
+    return {
+        "buckets": [start + timedelta(days=index * step) for index in range(buckets)],
+        "raws": raws,
+    }
+
+
+def load_snapshot():
+    """
+    Return the cached product, recipe and raw name snapshot used to answer
+    read-only questions, rebuilding it with three queries on a cache miss.
+    Stock levels are cached apart, see `load_cached_on_hand`.
+    """
+    snapshot = cache.get(SNAPSHOT_CACHE_KEY)
+    if snapshot is None:
+        products = {}
+        for product_id, name in Product.objects.values_list("id", "name"):
+            products.setdefault(name, product_id)
+        snapshot = {
+            "products": products,
+            "recipes": load_flat_recipes(),
+            "raw_names": dict(Raw.objects.order_by().values_list("id", "name")),
+        }
+        cache.set(SNAPSHOT_CACHE_KEY, snapshot, settings.PLANNING_SNAPSHOT_TIMEOUT)
+    return snapshot
+
+
+def load_cached_on_hand(raw_ids):
+    """
+    Return {raw_id: available quantity} for the given raws from their own
+    cache keys, reading the missing ones with one query.
+    """
+    keys = {ON_HAND_CACHE_KEY.format(raw_id): raw_id for raw_id in raw_ids}
+    on_hand = {keys[key]: quantity for key, quantity in cache.get_many(keys).items()}
+    missing = set(keys.values()) - set(on_hand)
+    if missing:
+        loaded = load_on_hand(missing, available=True)
+        loaded = {raw_id: loaded.get(raw_id, Decimal(0)) for raw_id in missing}
+        cache.set_many(
+            {ON_HAND_CACHE_KEY.format(raw_id): quantity for raw_id, quantity in loaded.items()},
+            settings.PLANNING_SNAPSHOT_TIMEOUT,
+        )
+        on_hand.update(loaded)
+    return on_hand
+
+
+def refresh_snapshot(stock_ids):
+    """
+    Store the available quantities of the given raw stocks under their own
+    cache keys, so concurrent moves of different raws never overwrite each
+    other and no move rewrites the whole snapshot.
+    """
+    on_hand = load_on_hand(
+        Raw.objects.filter(stock_id__in=stock_ids).values_list("id", flat=True), available=True
+    )
+    cache.set_many(
+        {ON_HAND_CACHE_KEY.format(raw_id): quantity for raw_id, quantity in on_hand.items()},
+        settings.PLANNING_SNAPSHOT_TIMEOUT,
+    )
+
+
+def check_feasibility(items, snapshot):
+    """
+    Check (product_name, quantity) pairs against the snapshot and the cached
+    stock of the raws they need, one by one and all together. Unknown
+    products are reported with feasible set to None.
+    """
+
+    def shortages_of(requirements):
+        shortages = []
+        for raw_id, required in requirements.items():
+            available = on_hand.get(raw_id, Decimal(0))
+            if required > available:
+                shortages.append(
+                    {
+                        "raw": raw_id,
+                        "name": snapshot["raw_names"].get(raw_id),
+                        "required": required,
+                        "available": available,
+                        "shortfall": required - available,
+                    }
+                )
+        return shortages
+
+    total = defaultdict(Decimal)
+    requested = []
+    for product_name, quantity in items:
+        product_id = snapshot["products"].get(product_name)
+        requirements = None
+        if product_id is not None:
+            requirements = {}
+            for raw_id, per_unit in snapshot["recipes"].get(product_id, {}).items():
+                requirements[raw_id] = quantity * per_unit
+                total[raw_id] += quantity * per_unit
+        requested.append((product_name, quantity, requirements))
+    on_hand = load_cached_on_hand(total)
+    results = []
+    for product_name, quantity, requirements in requested:
+        if requirements is None:
+            results.append(
+                {"product_name": product_name, "quantity": quantity, "feasible": None}
+            )
+            continue
+        shortages = shortages_of(requirements)
+        results.append(
+            {
+                "product_name": product_name,
+                "quantity": quantity,
+                "feasible": not shortages,
+                "shortages": shortages,
+            }
+        )
+    shortages = shortages_of(total)
+    return {
+        "feasible": not shortages and all(item["feasible"] for item in results),
+        "items": results,
+        "shortages": shortages,
+    }
+
+
+def suggest_raw_orders(personal=None):
+    """
+    Create one WAITING RawOrder per raw material whose open product order
+    demand exceeds stock plus the quantity already ordered, from the last
+    supplier of that raw. Raws never ordered before are skipped and returned.
+    """
+    demand = (
+        ProductOrder.objects.filter(status=WAITING)
+        .order_by()
+        .values_list("product_id")
+        .annotate(quantity=Sum("quantity"))
+    )
+    demand = {product_id: quantity for product_id, quantity in demand if quantity}
+    recipes = load_flat_recipes(demand)
+    gross = defaultdict(Decimal)
+    for product_id, quantity in demand.items():
+        for raw_id, per_unit in recipes.get(product_id, {}).items():
+            gross[raw_id] += quantity * per_unit
+    ordered = dict(
+        RawOrder.objects.filter(status=WAITING, raw_id__in=gross)
+        .order_by()
+        .values_list("raw_id")
+        .annotate(quantity=Sum("quantity"))
+    )
+    on_hand = load_on_hand()
+    shortages = {}
+    for raw_id, quantity in gross.items():
+        shortage = quantity - on_hand.get(raw_id, 0) - (ordered.get(raw_id) or 0)
+        if shortage > 0:
+            shortages[raw_id] = shortage.to_integral_value(rounding=ROUND_CEILING)
+
+    last_supplier = (
+        RawOrder.objects.filter(raw=OuterRef("pk"))
+        .order_by("-created_at")
+        .values("supplier_id")[:1]
+    )
+    raws = (
+        Raw.objects.filter(id__in=shortages)
+        .annotate(last_supplier_id=Subquery(last_supplier))
+        .values_list("id", "last_supplier_id", "unit_price")
+    )
+    suggestions = []
+    skipped = []
+    for raw_id, supplier_id, unit_price in raws:
+        if supplier_id is None:
+            skipped.append(raw_id)
+            continue
+        suggestions.append(
+            RawOrder(
+                supplier_id=supplier_id,
+                raw_id=raw_id,
+                personal=personal,
+                order_title=SUGGESTED_RAW_ORDER_TITLE,
+                quantity=shortages[raw_id],
+                status=WAITING,
+                total=(unit_price or Decimal(0)) * shortages[raw_id],
+            )
+        )
+    with transaction.atomic():
+        RawOrder.objects.bulk_create(suggestions, batch_size=1000)
+        if suggestions:
+            # bulk_create sends no post_save, so the table version is moved here
+            bump_versions(RawOrder)
+    return {"created": len(suggestions), "skipped": skipped}
+
+
+def compute_producible(recipes, on_hand):
+    """
+    Return how many units of each product the raw stock allows, the minimum
+    over its recipe of stock // quantity. Recipe rows needing no quantity do
+    not limit it, and products without a recipe get None.
+    """
+    return {
+        product_id: min(
+            (
+                int(on_hand.get(raw_id, 0) // quantity)
+                for raw_id, quantity in raws.items()
+                if quantity > 0
+            ),
+            default=None,
+        )
+        for product_id, raws in recipes.items()
+    }
+
+
+def load_producible():
+    report = cache.get(PRODUCIBLE_CACHE_KEY)
+    if report is None:
+        report = compute_producible(load_flat_recipes(), load_on_hand(available=True))
+        cache.set(PRODUCIBLE_CACHE_KEY, report, settings.PRODUCIBLE_REPORT_TIMEOUT)
+    return report
+
+
+def refresh_producible(stock_ids):
+    """
+    Recompute the cached report for the products using the given raw stocks.
+    """
+    report = cache.get(PRODUCIBLE_CACHE_KEY)
+    if report is None:
+        return
+    product_ids = set(
+        FlatRecipe.objects.filter(raw__stock_id__in=stock_ids)
+        .order_by()
+        .values_list("product_id", flat=True)
+    )
+    recipes = load_flat_recipes(product_ids)
+    raw_ids = {raw_id for raws in recipes.values() for raw_id in raws}
+    on_hand = load_on_hand(raw_ids, available=True)
+    report.update(compute_producible(recipes, on_hand))
+    cache.set(PRODUCIBLE_CACHE_KEY, report, settings.PRODUCIBLE_REPORT_TIMEOUT)
@@ -0,0 +1,153 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from product.models import FlatRecipe
+from stock.constant import CONSUMPTION
+from stock.models import RawStock
+from stock.tools import InsufficientStockError, group_deltas, move_stock, reserve_stock
+from system.constant import WAITING, FAIL
+from system.models import ProductOrder, StockReservation, publish_on_commit
+from system.versions import bump_versions
+
+
+def order_quantities(order):
+    """
+    Return the {stock_id: quantity} of raw materials a product order needs.
+    """
+    recipe = FlatRecipe.objects.filter(product_id=order.product_id).values_list(
+        "raw__stock_id", "quantity_for_prod"
+    )
+    return group_deltas((stock_id, order.quantity * quantity) for stock_id, quantity in recipe)
+
+
+def reserve_order(order):
+    """
+    Hold the raw materials a WAITING product order needs until it succeeds,
+    fails or STOCK_RESERVATION_TTL seconds pass.
+    """
+    quantities = order_quantities(order)
+    expires_at = timezone.now() + timedelta(seconds=settings.STOCK_RESERVATION_TTL)
+    with transaction.atomic():
+        reserve_stock(quantities)
+        StockReservation.objects.bulk_create(
+            [
+                StockReservation(
+                    product_order=order,
+                    raw_stock_id=stock_id,
+                    quantity=quantity,
+                    expires_at=expires_at,
+                )
+                for stock_id, quantity in quantities.items()
+            ]
+        )
+    return quantities
+
+
+def consume_reservations(order):
+    """
+    Turn the reservations of a successful order into raw stock consumption
+    and return its {stock_id: (average_value, fifo_value)}, see move_stock.
+
+    An order whose reservations were already released, because it failed or
+    expired, consumes its recipe again from the stock not reserved for other
+    orders, and raises InsufficientStockError when that does not cover it.
+    """
+    with transaction.atomic():
+        reservations = StockReservation.objects.select_for_update().filter(
+            product_order_id=order.id
+        )
+        quantities = group_deltas(reservations.values_list("raw_stock_id", "quantity"))
+        if quantities:
+            reservations.delete()
+            reserve_stock({stock_id: -quantity for stock_id, quantity in quantities.items()})
+        else:
+            quantities = order_quantities(order)
+            check_available(quantities)
+        return move_stock(
+            RawStock,
+            {stock_id: -quantity for stock_id, quantity in quantities.items()},
+            CONSUMPTION,
+        )
+
+
+def check_available(quantities):
+    """
+    Lock the RawStock rows of {stock_id: quantity} and raise
+    InsufficientStockError if any has less available than asked for.
+    """
+    available = dict(
+        RawStock.objects.select_for_update()
+        .filter(id__in=quantities)
+        .annotate(free=F("count") - F("reserved"))
+        .values_list("id", "free")
+    )
+    short = sorted(
+        stock_id for stock_id, quantity in quantities.items()
+        if available.get(stock_id, 0) < quantity
+    )
+    if short:
+        raise InsufficientStockError(
+            "Raw material stocks {} cannot cover the consumption.".format(short)
+        )
+
+
+def release_order(order_id):
+    with transaction.atomic():
+        reservations = StockReservation.objects.select_for_update().filter(
+            product_order_id=order_id
+        )
+        quantities = group_deltas(reservations.values_list("raw_stock_id", "quantity"))
+        reservations.delete()
+        reserve_stock({stock_id: -quantity for stock_id, quantity in quantities.items()})
+    return quantities
+
+
+def release_reservations(now=None):
+    """
+    Release, in one pass, the reservations of failed orders and the expired
+    ones, marking WAITING orders whose reservations expired as FAIL.
+    Reservations locked by a running order update are left for the next run.
+    The orders are failed with one UPDATE, so their events and table version
+    are sent here instead of by the post_save receivers.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        rows = list(
+            StockReservation.objects.select_for_update(skip_locked=True, of=("self",))
+            .filter(Q(product_order__status=FAIL) | Q(expires_at__lte=now))
+            .values_list("id", "product_order_id", "raw_stock_id", "quantity")
+        )
+        if not rows:
+            return {"released": 0, "expired_orders": 0}
+        expired = ProductOrder.objects.select_for_update().filter(
+            id__in={order_id for row_id, order_id, stock_id, quantity in rows},
+            status=WAITING,
+        )
+        expired_orders = list(expired.values_list("id", "product_id", "quantity"))
+        if expired_orders:
+            ProductOrder.objects.filter(
+                id__in=[order_id for order_id, product_id, quantity in expired_orders]
+            ).update(status=FAIL, updated_at=now)
+            bump_versions(ProductOrder)
+            for order_id, product_id, quantity in expired_orders:
+                publish_on_commit(
+                    {
+                        "type": "product_order",
+                        "id": order_id,
+                        "product": product_id,
+                        "quantity": quantity,
+                        "status": FAIL,
+                        "created": False,
+                    }
+                )
+        StockReservation.objects.filter(
+            id__in=[row_id for row_id, order_id, stock_id, quantity in rows]
+        ).delete()
+        reserve_stock(
+            group_deltas(
+                (stock_id, -quantity) for row_id, order_id, stock_id, quantity in rows
+            )
+        )
+    return {"released": len(rows), "expired_orders": len(expired_orders)}
@@ -1,11 +1,15 @@
 from rest_framework import serializers
+from django.db.models import Prefetch
 from django.template.defaultfilters import date as _date
-from system.models import Client, Supplier, RawOrder, ProductOrder, Budget, DamagedProduct, DamagedRaw
+from system.models import Client, Supplier, RawOrder, ProductOrder, Budget, DamagedProduct, DamagedRaw, \
+    MaterialRequirement, StockAlert, BudgetAccount, BudgetRollup
+from product.models import FlatRecipe, RawForProduction
 from product.serializers import RawSerializer, ProductSerializer
 from profile.serializers import UserProfileSerializer
+from api.v1.fieldsets import SparseFieldsMixin
 
 
-class ClientSerializer(serializers.ModelSerializer):
+class ClientSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     created_at = serializers.SerializerMethodField()
     updated_at = serializers.SerializerMethodField()
 
@@ -29,7 +33,7 @@ class ClientUpdateSerializer(serializers.ModelSerializer):
                   'phone', 'company', 'address')
 
 
-class SupplierSerializer(serializers.ModelSerializer):
+class SupplierSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     created_at = serializers.SerializerMethodField()
     updated_at = serializers.SerializerMethodField()
 
@@ -53,13 +57,18 @@ class SupplierUpdateSerializer(serializers.ModelSerializer):
                   'phone', 'address', 'company')
 
 
-class RawOrderSerializer(serializers.ModelSerializer):
+class RawOrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     supplier = SupplierSerializer(many=False, read_only=True)
     user = UserProfileSerializer(many=False, read_only=True)
     raw = RawSerializer(many=False, read_only=True)
     created_at = serializers.SerializerMethodField()
     updated_at = serializers.SerializerMethodField()
 
+    related = {
+        "supplier": (("supplier",), ()),
+        "raw": (("raw__stock",), ()),
+    }
+
     class Meta:
         model = RawOrder
         fields = ('id', 'status', 'quantity', 'total',
@@ -72,13 +81,25 @@ class RawOrderSerializer(serializers.ModelSerializer):
         return _date(obj.updated_at, "d F, Y - H:m")
 
 
-class ProductOrderSerializer(serializers.ModelSerializer):
+class ProductOrderSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     client = ClientSerializer(many=False, read_only=True)
     product = ProductSerializer(many=False, read_only=True)
     user = UserProfileSerializer(many=False, read_only=True)
     created_at = serializers.SerializerMethodField()
     updated_at = serializers.SerializerMethodField()
 
+    related = {
+        "client": (("client",), ()),
+        "product": (
+            ("product__stock",),
+            (
+                Prefetch("product__raws", RawForProduction.objects.select_related("raw")),
+                Prefetch("product__flat_raws", FlatRecipe.objects.select_related("raw")),
+                "product__attr",
+            ),
+        ),
+    }
+
     class Meta:
         model = ProductOrder
         fields = ('id', 'status', 'quantity', 'total',
@@ -138,7 +159,29 @@ class BudgetTotalSerializer(serializers.ModelSerializer):
         return _date(obj.updated_at, "d F, Y - H:m")
 
 
-class BudgetSerializer(serializers.ModelSerializer):
+class BudgetAccountSerializer(serializers.ModelSerializer):
+    created_at = serializers.SerializerMethodField()
+    updated_at = serializers.SerializerMethodField()
+
+    class Meta:
+        model = BudgetAccount
+        fields = ('id', 'total', 'created_at', 'updated_at', )
+
+    def get_created_at(self, obj):
+        return _date(obj.created_at, "d F, Y - H:m")
+
+    def get_updated_at(self, obj):
+        return _date(obj.updated_at, "d F, Y - H:m")
+
+
+class BudgetRollupSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = BudgetRollup
+        fields = ('granularity', 'period', 'income', 'expense', 'salaries', 'net', )
+
+
+class BudgetSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     created_at = serializers.SerializerMethodField()
     updated_at = serializers.SerializerMethodField()
 
@@ -154,12 +197,24 @@ class BudgetSerializer(serializers.ModelSerializer):
         return _date(obj.updated_at, "d F, Y - H:m")
 
 
-class BudgetDetailSerializer(serializers.ModelSerializer):
+class BudgetDetailSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     product_order = ProductOrderSerializer(many=False, read_only=True)
     raw_order = RawOrderSerializer(many=False, read_only=True)
     created_at = serializers.SerializerMethodField()
     updated_at = serializers.SerializerMethodField()
 
+    related = {
+        "product_order": (
+            ("product_order__client", "product_order__product__stock"),
+            (
+                Prefetch("product_order__product__raws", RawForProduction.objects.select_related("raw")),
+                Prefetch("product_order__product__flat_raws", FlatRecipe.objects.select_related("raw")),
+                "product_order__product__attr",
+            ),
+        ),
+        "raw_order": (("raw_order__supplier", "raw_order__raw__stock"), ()),
+    }
+
     class Meta:
         model = Budget
         fields = ('id', 'product_order', 'raw_order', 'total_income', 'total_outcome',
@@ -170,3 +225,34 @@ class BudgetDetailSerializer(serializers.ModelSerializer):
 
     def get_updated_at(self, obj):
         return _date(obj.updated_at, "d F, Y - H:m")
+
+
+class MaterialRequirementSerializer(serializers.ModelSerializer):
+    raw = RawSerializer(many=False, read_only=True)
+    updated_at = serializers.SerializerMethodField()
+
+    class Meta:
+        model = MaterialRequirement
+        fields = ('id', 'raw', 'gross_requirement', 'on_hand', 'net_requirement', 'updated_at', )
+
+    def get_updated_at(self, obj):
+        return _date(obj.updated_at, "d F, Y - H:m")
+
+
+class StockAlertSerializer(serializers.ModelSerializer):
+    name = serializers.SerializerMethodField()
+    stock = serializers.SerializerMethodField()
+    created_at = serializers.SerializerMethodField()
+
+    class Meta:
+        model = StockAlert
+        fields = ('id', 'raw', 'product', 'name', 'stock', 'count', 'reorder_level', 'notified', 'created_at', )
+
+    def get_name(self, obj):
+        return (obj.raw or obj.product).name
+
+    def get_stock(self, obj):
+        return (obj.raw or obj.product).stock.name
+
+    def get_created_at(self, obj):
+        return _date(obj.created_at, "d F, Y - H:m")
@@ -0,0 +1,120 @@
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from functools import partial
+from django.conf import settings
+from product.bom import load_flat_recipes
+from product.models import Product, Raw
+from system.constant import WAITING, SUCCESS
+from system.ledger import load_account
+
+
+def load_world():
+    """
+    Copy the stock, price, recipe and budget data a scenario can touch into
+    plain dictionaries, so simulations run without the database.
+    """
+    products = {}
+    product_stock = {}
+    for product_id, name, stock_id, count, unit_price in Product.objects.order_by(
+        "-created_at"
+    ).values_list("id", "name", "stock_id", "stock__count", "unit_price"):
+        products.setdefault(name, (product_id, stock_id, unit_price or Decimal(0)))
+        product_stock[stock_id] = Decimal(count)
+    raws = {}
+    raw_stock_ids = {}
+    raw_stock = {}
+    for raw_id, name, stock_id, count, reserved, unit_price in Raw.objects.order_by(
+        "-created_at"
+    ).values_list(
+        "id", "name", "stock_id", "stock__count", "stock__reserved", "unit_price"
+    ):
+        raws.setdefault(name, (raw_id, stock_id, unit_price or Decimal(0)))
+        raw_stock_ids[raw_id] = stock_id
+        raw_stock[stock_id] = Decimal(count - reserved)
+    return {
+        "products": products,
+        "raws": raws,
+        "raw_stock_ids": raw_stock_ids,
+        "product_stock": product_stock,
+        "raw_stock": raw_stock,
+        "recipes": load_flat_recipes(),
+        "budget": getattr(load_account(), "total", Decimal(0)),
+    }
+
+
+def simulate(world, scenario):
+    """
+    Apply a hypothetical scenario to a world loaded by `load_world`.
+
+    A scenario may hold `price_changes` ({product_name or raw_name,
+    unit_price}), `raw_deliveries` ({raw_name, quantity}, booked like a
+    successful raw order) and `product_orders` ({product_name, quantity,
+    status}). WAITING orders only consume raw materials, SUCCESS orders also
+    add the product to stock and its price to the budget, like the order
+    signals do. Unknown names raise KeyError.
+    """
+    products = dict(world["products"])
+    raws = dict(world["raws"])
+    product_stock = defaultdict(Decimal)
+    raw_stock = defaultdict(Decimal)
+    budget = world["budget"]
+
+    for change in scenario.get("price_changes", ()):
+        unit_price = Decimal(str(change["unit_price"]))
+        if change.get("product_name"):
+            product_id, stock_id, old_price = products[change["product_name"]]
+            products[change["product_name"]] = (product_id, stock_id, unit_price)
+        else:
+            raw_id, stock_id, old_price = raws[change["raw_name"]]
+            raws[change["raw_name"]] = (raw_id, stock_id, unit_price)
+
+    for delivery in scenario.get("raw_deliveries", ()):
+        raw_id, stock_id, unit_price = raws[delivery["raw_name"]]
+        quantity = Decimal(str(delivery["quantity"]))
+        raw_stock[stock_id] += quantity
+        budget -= unit_price * quantity
+
+    for order in scenario.get("product_orders", ()):
+        product_id, stock_id, unit_price = products[order["product_name"]]
+        quantity = Decimal(str(order["quantity"]))
+        for raw_id, per_unit in world["recipes"].get(product_id, {}).items():
+            raw_stock[world["raw_stock_ids"][raw_id]] -= quantity * per_unit
+        if order.get("status", WAITING) == SUCCESS:
+            product_stock[stock_id] += quantity
+            budget += unit_price * quantity
+
+    raw_levels = {}
+    shortages = []
+    for name, (raw_id, stock_id, unit_price) in raws.items():
+        if stock_id not in raw_stock:
+            continue
+        level = world["raw_stock"][stock_id] + raw_stock[stock_id]
+        raw_levels[name] = level
+        if level < 0:
+            shortages.append({"raw_name": name, "shortfall": -level})
+    return {
+        "product_stock": {
+            name: world["product_stock"][stock_id] + product_stock[stock_id]
+            for name, (product_id, stock_id, unit_price) in products.items()
+            if stock_id in product_stock
+        },
+        "raw_stock": raw_levels,
+        "shortages": shortages,
+        "budget_total": budget,
+    }
+
+
+def simulate_many(scenarios, workers=None):
+    """
+    Run every scenario against one snapshot of the database, fanning batches
+    out over a pool of SIMULATION_WORKERS processes (one per CPU if unset).
+    """
+    run = partial(simulate, load_world())
+    workers = workers or settings.SIMULATION_WORKERS or os.cpu_count()
+    if len(scenarios) < 2 or workers == 1:
+        return [run(scenario) for scenario in scenarios]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(len(scenarios) // (workers * 4), 1)
+        return list(executor.map(run, scenarios, chunksize=chunksize))
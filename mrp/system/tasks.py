@@ -1,15 +1,54 @@
 from __future__ import absolute_import, unicode_literals
 from celery import task
-from profile.models import UserProfile
-from system.models import Budget
-from decimal import Decimal
+from system.payroll import run_payroll
+from system.ledger import rebuild_totals
+from system.planning import run_mrp, replan_raws, suggest_raw_orders
+from system.reservations import release_reservations
+from system.alerts import deliver_stock_alerts
 
 
 @task()
 def task_pay_salaries():
-    total_salary = Decimal(0)
-    users = UserProfile.objects.filter()
-    for user in users:
-        total_salary += user.salary
-    budget = Budget.objects.filter().first()
-    Budget.objects.create(salaries=total_salary, total=budget.total)
+    payroll_run = run_payroll()
+    if payroll_run is not None:
+        return {
+            "period": str(payroll_run.period),
+            "employees": payroll_run.employees,
+            "total": str(payroll_run.total),
+        }
+
+
+@task()
+def task_run_mrp():
+    return run_mrp()
+
+
+@task()
+def task_suggest_raw_orders():
+    return suggest_raw_orders()
+
+
+@task()
+def task_replan_raws(stock_ids):
+    replan_raws(stock_ids)
+
+
+@task()
+def task_release_reservations():
+    return release_reservations()
+
+
+@task()
+def task_deliver_stock_alerts():
+    return deliver_stock_alerts()
+
+
+@task()
+def task_check_budget_totals(fix=False):
+    report = rebuild_totals(fix=fix)
+    return {
+        "rows": report["rows"],
+        "divergent": report["divergent"],
+        "first": [divergence["id"] for divergence in report["divergences"]],
+        "drift": str(report["drift"]),
+    }
@@ -0,0 +1,38 @@
+from decimal import Decimal
+from product.models import Product, Raw
+from system.constant import AVERAGE, FIFO
+
+
+def inventory_valuation(method=AVERAGE):
+    """
+    Value every raw material and product on hand at weighted average or FIFO
+    cost, read from the valuations kept by stock.tools.move_stock with one
+    query per item type. Items sharing a stock share its valuation.
+    """
+    if method == FIFO:
+        value_field = "stock__valuation__fifo_value"
+    else:
+        value_field = "stock__valuation__average_value"
+    items = []
+    total = Decimal(0)
+    for kind, model in (("raw", Raw), ("product", Product)):
+        rows = model.objects.order_by("name").values_list(
+            "id", "name", "stock__name", "stock__valuation__quantity", value_field
+        )
+        for item_id, name, stock, quantity, value in rows:
+            quantity, value = quantity or 0, value or Decimal(0)
+            items.append(
+                {
+                    "type": kind,
+                    "id": item_id,
+                    "name": name,
+                    "stock": stock,
+                    "quantity": quantity,
+                    "unit_cost": (value / quantity).quantize(Decimal("0.0001"))
+                    if quantity
+                    else Decimal(0),
+                    "value": value,
+                }
+            )
+            total += value
+    return {"method": method, "items": items, "total": total}
@@ -0,0 +1,38 @@
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from system.models import TableVersion
+
+
+def table_name(model):
+    return model._meta.label_lower
+
+
+def bump_versions(*models):
+    """
+    Move the version of the given models' tables forward once the current
+    transaction commits, so a version never runs ahead of the data readers
+    can see and the row lock is not held for the rest of the transaction.
+    """
+    names = [table_name(model) for model in models]
+    transaction.on_commit(lambda: add_versions(names))
+
+
+def add_versions(names):
+    now = timezone.now()
+    for name in names:
+        version = TableVersion.objects.filter(name=name)
+        if not version.update(version=F("version") + 1, updated_at=now):
+            TableVersion.objects.get_or_create(name=name, defaults={"updated_at": now})
+            version.update(version=F("version") + 1, updated_at=now)
+
+
+def load_versions(models):
+    """
+    Return {table: version} for the given models' tables. A table nothing
+    was written to since versions were kept is at version 0.
+    """
+    names = [table_name(model) for model in models]
+    versions = dict.fromkeys(names, 0)
+    versions.update(TableVersion.objects.filter(name__in=names).values_list("name", "version"))
+    return versions